@@ -5,31 +5,70 @@ For more details about this integration, please refer to
 https://github.com/tmenguy/hacs-diffazur-hydrocapt
 """
 import asyncio
-import copy
-from datetime import timedelta
+from datetime import datetime, timedelta
 import logging
+import os
+import random
 
 try:
-    from diffazur_hydrocapt.hydrocapt_lib.client import HydrocaptClient
+    from diffazur_hydrocapt.hydrocapt_lib.async_client import AsyncHydrocaptClient
+    from diffazur_hydrocapt.hydrocapt_lib.exceptions import HydrocaptAuthError, HydrocaptCircuitOpenError
+    from diffazur_hydrocapt.hydrocapt_lib.store import HydrocaptSeriesStore
 except:
-    from .hydrocapt_lib.client import HydrocaptClient
+    from .hydrocapt_lib.async_client import AsyncHydrocaptClient
+    from .hydrocapt_lib.exceptions import HydrocaptAuthError, HydrocaptCircuitOpenError
+    from .hydrocapt_lib.store import HydrocaptSeriesStore
 
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.core_config import Config
-from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.exceptions import ConfigEntryNotReady, HomeAssistantError
+from homeassistant.helpers.aiohttp_client import async_create_clientsession
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+from homeassistant.util import dt as dt_util
 from homeassistant.const import CONF_EMAIL, CONF_PASSWORD
 
 
 from .const import (
     PLATFORMS,
     DOMAIN,
+    NAME,
+    VERSION,
+    MANUFACTURER,
     STARTUP_MESSAGE,
     CONF_POOL_ID,
-    CONF_INTERNAL_POOL_ID
+    CONF_INTERNAL_POOL_ID,
+    STORAGE_VERSION,
+    SESSION_STORAGE_KEY,
+    SESSION_SAVE_DELAY,
+    SNAPSHOT_STORAGE_KEY,
+    SNAPSHOT_SAVE_DELAY,
+    SNAPSHOT_DATETIME_KEYS,
+    BACKFILL_STORAGE_KEY,
+    SERIES_STORE_DIR,
+    SERIES_STORE_FILE,
+    REFRESH_DEADLINE_S,
+    WRITE_DEADLINE_S,
+    CONF_ALARMS_CACHE_TTL,
+    DEFAULT_ALARMS_CACHE_TTL_MIN,
+    CONF_MAX_STALENESS,
+    DEFAULT_MAX_STALENESS_MIN,
+    STALE_RETRY_MIN,
+    STALE_RETRY_MAX,
+    TIER_COMMANDS,
+    TIER_MEASURES,
+    TIER_SETPOINTS,
+    TIERS,
+    COMMANDS_REFRESH_INTERVAL,
+    SETPOINTS_REFRESH_INTERVAL,
+    TIER_GROUPING,
+    SLOT_MIN_INTERVAL,
 )
+from .services import async_setup_services
+from .scheduler import HydrocaptSlotScheduler
+from .statistics import HydrocaptStatisticsImporter, HydrocaptHistoryBackfill
 
 
 SCAN_INTERVAL = timedelta(minutes=60)
@@ -39,6 +78,7 @@ _LOGGER: logging.Logger = logging.getLogger(__package__)
 
 async def async_setup(hass: HomeAssistant, config: Config):
     """Set up this integration using YAML is not supported."""
+    async_setup_services(hass)
     return True
 
 
@@ -53,17 +93,60 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     pool_id = entry.data.get(CONF_POOL_ID, -1)
     pool_internal_id  = entry.data.get(CONF_INTERNAL_POOL_ID, -1)
 
-    client = HydrocaptClient(username=username, password=password, pool_id=pool_id, pool_internal_id=pool_internal_id)
+    # keep the hydrocapt session cookies across restarts to avoid a full login each time
+    session_store = Store(hass, STORAGE_VERSION, SESSION_STORAGE_KEY.format(entry_id=entry.entry_id))
+
+    @callback
+    def _async_save_auth_state(auth_state):
+        session_store.async_delay_save(lambda: auth_state, SESSION_SAVE_DELAY)
+
+    # dedicated aiohttp session: the hydrocapt authentication lives in its cookie jar
+    client = AsyncHydrocaptClient(
+        username=username,
+        password=password,
+        pool_id=pool_id,
+        pool_internal_id=pool_internal_id,
+        websession=async_create_clientsession(hass),
+        on_login=_async_save_auth_state,
+        alarms_cache_ttl_s=entry.options.get(CONF_ALARMS_CACHE_TTL, DEFAULT_ALARMS_CACHE_TTL_MIN)*60,
+    )
+
+    # checked with a cheap request on first refresh, login again only if it is stale
+    client.restore_auth_state(await session_store.async_load())
 
-    coordinator = DiffazurHydrocaptDataUpdateCoordinator(hass, client)
+    # last good data: entities start from it, marked stale, while the first refresh runs in background
+    snapshot_store = Store(hass, STORAGE_VERSION, SNAPSHOT_STORAGE_KEY.format(entry_id=entry.entry_id))
 
-    try:
-        await coordinator.async_refresh()
-    except:
-        raise ConfigEntryNotReady
+    coordinator = DiffazurHydrocaptDataUpdateCoordinator(
+        hass,
+        client,
+        snapshot_store=snapshot_store,
+        backfill_store=Store(hass, STORAGE_VERSION, BACKFILL_STORAGE_KEY.format(entry_id=entry.entry_id)),
+        series_store_dir=hass.config.path(SERIES_STORE_DIR),
+        max_staleness=timedelta(minutes=entry.options.get(CONF_MAX_STALENESS, DEFAULT_MAX_STALENESS_MIN)),
+    )
 
-    if not coordinator.last_update_success:
-        raise ConfigEntryNotReady
+    # entity ids need the pool id: without it, wait for a real refresh
+    if client.pool_internal_id >= 0 and coordinator.async_restore_snapshot(await snapshot_store.async_load()):
+        # tracked by the coordinator: a reload goes through async_unload_entry, which must stop it
+        coordinator.async_create_background_task(coordinator.async_refresh(), f"{DOMAIN} first refresh")
+    else:
+        try:
+            await coordinator.async_refresh()
+        except:
+            await coordinator.async_close()
+            raise ConfigEntryNotReady
+
+        if not coordinator.last_update_success:
+            # setup is retried with a new client: don't leave this one's connections open
+            await coordinator.async_close()
+            raise ConfigEntryNotReady
+
+    # resolved by the first refresh: keep it in the entry so next setups skip the pool discovery
+    if client.pool_internal_id >= 0 and entry.data.get(CONF_INTERNAL_POOL_ID, -1) != client.pool_internal_id:
+        hass.config_entries.async_update_entry(
+            entry, data={**entry.data, CONF_INTERNAL_POOL_ID: client.pool_internal_id}
+        )
 
     hass.data[DOMAIN][entry.entry_id] = coordinator
 
@@ -85,40 +168,154 @@ class DiffazurHydrocaptDataUpdateCoordinator(DataUpdateCoordinator):
     def __init__(
         self,
         hass: HomeAssistant,
-        client: HydrocaptClient,
+        client: AsyncHydrocaptClient,
+        snapshot_store: Store = None,
+        backfill_store: Store = None,
+        series_store_dir: str = None,
+        max_staleness: timedelta = timedelta(minutes=DEFAULT_MAX_STALENESS_MIN),
     ) -> None:
         """Initialize."""
         self.api = client
+        self._snapshot_store = snapshot_store
+        # data restored from the snapshot and not refreshed yet, or kept while refreshes fail
+        self.stale = False
+        self._max_staleness = max_staleness
+        # failed refreshes in a row
+        self._failures = 0
+        # when each key was last read from the cloud
+        self.key_updated_at = {}
         self.platforms = []
+        self._timer_flush_tasks = {}
+        self._device_info = None
+        self._device_info_pool_id = None
+        # refresh just after each new hourly measure slot instead of every SCAN_INTERVAL
+        self._scheduler = HydrocaptSlotScheduler()
+        # each tier has its own next refresh time (None: due now)
+        self._tier_next_refresh = {tier: None for tier in TIERS}
+        # keys that changed in the data being published, None to notify every entity
+        self._changed_keys = None
+        self._last_notified_state = None
+        # created once the pool id is known, the statistic ids depend on it
+        self._statistics = None
+        self._backfill = HydrocaptHistoryBackfill(hass, client, backfill_store) if backfill_store is not None else None
+        # local copy of the hourly measures, opened in the executor once the pool id is known
+        self._series_store_dir = series_store_dir
+        self._series_store = None
+        # work started for this entry, stopped or awaited by async_close
+        self._background_tasks = set()
+        self._series_store_jobs = set()
+        self._closed = False
         super().__init__(hass, _LOGGER, name=DOMAIN, update_interval=SCAN_INTERVAL)
 
 
     def get_pool_id(self):
-        return self.api.get_pool_id()
-
-    def set_command_state(self, command, state):
-        self.api.set_command_state(command, state)
-        data = self.api.get_packaged_data()
-        self.data = data
-        return data
-
-    def set_consign(self, consign, value):
-        self.api.set_consign(consign, value)
-        data = self.api.get_packaged_data()
-        self.data = data
-        return data
-
-    def set_consign_timer_hour(self, consign, hour_idx, value):
-        self.api.set_consign_timer_hour(consign, hour_idx, value)
-        data = self.api.get_packaged_data()
-        self.data = data
-        return data
-
-    def set_and_fetch_command_state(self, command, state):
-        prev_state = self.api.set_command_state(command, state, get_prev=True)
-        data = self.api.get_packaged_data()
-        self.data = data
-        return prev_state, data
+        # known once the first refresh went through, never touch the network from a property
+        return self.api.pool_internal_id
+
+    @property
+    def device_info(self):
+        """Device of the pool, shared by all its entities."""
+        pool_id = self.get_pool_id()
+        if self._device_info is None or self._device_info_pool_id != pool_id:
+            self._device_info_pool_id = pool_id
+            self._device_info = {
+                "identifiers": {(DOMAIN, pool_id)},
+                "name": f"{NAME} (pool id: {pool_id})",
+                "model": VERSION,
+                "manufacturer": MANUFACTURER,
+            }
+        return self._device_info
+
+    async def set_command_state(self, command, state):
+        # return as soon as the write is accepted, the confirmation reconciles the state later
+        await self.api.set_command_state(command, state, deadline=WRITE_DEADLINE_S, wait_confirm=False)
+        return self._get_optimistic_data(command)
+
+    async def set_consign(self, consign, value):
+        await self.api.set_consign(consign, value, deadline=WRITE_DEADLINE_S, wait_confirm=False)
+        return self._get_optimistic_data(consign)
+
+    async def set_consign_timer_hour(self, consign, hour_idx, value):
+        # hour edits of a timer are coalesced by the client and saved together once the user stops clicking
+        flush_task = await self.api.queue_consign_timer_hour(consign, hour_idx, value, deadline=WRITE_DEADLINE_S)
+        if flush_task is not None and self._timer_flush_tasks.get(consign) is not flush_task:
+            self._timer_flush_tasks[consign] = flush_task
+            flush_task.add_done_callback(lambda task: self._async_timer_flushed(consign, task))
+
+        return self._merge_data(self.api.get_packaged_data())
+
+    @callback
+    def _async_timer_flushed(self, consign, task):
+        if self._timer_flush_tasks.get(consign) is task:
+            del self._timer_flush_tasks[consign]
+
+        if task.cancelled():
+            return
+
+        if task.exception() is not None:
+            _LOGGER.warning("Hydrocapt timer %s not saved, refreshing: %s", consign, task.exception())
+            self.async_create_background_task(self.async_refresh_tiers([TIER_SETPOINTS]), f"{DOMAIN} setpoints refresh")
+            return
+
+        confirm_task = self.api.get_confirm_task(consign)
+        if confirm_task is not None:
+            confirm_task.add_done_callback(self._async_reconcile)
+
+    async def set_and_fetch_command_state(self, command, state):
+        prev_state = await self.api.set_command_state(command, state, get_prev=True, deadline=WRITE_DEADLINE_S, wait_confirm=False)
+        return prev_state, self._get_optimistic_data(command)
+
+    async def set_command_states(self, commands):
+        # one save request and one confirmation read for the whole batch
+        await self.api.set_command_states(commands, deadline=WRITE_DEADLINE_S, wait_confirm=False)
+        return self._get_optimistic_data(*commands)
+
+    async def async_refresh_alarm_thresholds(self):
+        # thresholds are changed in the hydrocapt app, re-read them now instead of waiting for the cache to expire
+        self.api.invalidate_alarms_cache()
+        await self.async_refresh_tiers([TIER_MEASURES])
+
+    async def async_refresh_tiers(self, tiers):
+        """Refresh the given tiers now, whatever their schedule."""
+        for tier in tiers:
+            self._tier_next_refresh[tier] = None
+        await self.async_request_refresh()
+
+    def _get_optimistic_data(self, *keys):
+        tasks = {self.api.get_confirm_task(key) for key in keys}
+        for task in tasks:
+            if task is not None:
+                task.add_done_callback(self._async_reconcile)
+
+        return self._merge_data(self.api.get_packaged_data())
+
+    @callback
+    def _async_reconcile(self, task):
+        """Publish the confirmed state, or refresh if the write could not be confirmed."""
+        if task.cancelled():
+            #superseded by a newer write of the same key
+            return
+
+        if task.exception() is not None:
+            _LOGGER.warning("Hydrocapt write not confirmed, refreshing: %s", task.exception())
+            self.async_create_background_task(
+                self.async_refresh_tiers([TIER_COMMANDS, TIER_SETPOINTS]), f"{DOMAIN} commands refresh"
+            )
+            return
+
+        self.async_set_updated_data(self._merge_data(self.api.get_packaged_data()))
+        self._async_save_snapshot()
+
+    @callback
+    def async_create_background_task(self, target, name):
+        """Run target in the background until it ends or async_close cancels it."""
+        if self._closed:
+            target.close()
+            return None
+        task = self.hass.async_create_background_task(target, name)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
 
     def get_commands_and_options(self):
         return self.api.get_commands_and_options()
@@ -136,26 +333,247 @@ class DiffazurHydrocaptDataUpdateCoordinator(DataUpdateCoordinator):
     def get_heating_regulation_water_temperature(self):
         return self.api.get_heating_regulation_water_temperature()
 
+    def _get_due_tiers(self, now):
+        return [
+            tier for tier in TIERS
+            if self._tier_next_refresh[tier] is None or self._tier_next_refresh[tier] - TIER_GROUPING <= now
+        ]
+
+    @callback
+    def async_restore_snapshot(self, snapshot):
+        """Start from a saved snapshot, return False if there is none."""
+        if not snapshot or not snapshot.get("data"):
+            return False
+
+        data = dict(snapshot["data"])
+        for k in SNAPSHOT_DATETIME_KEYS:
+            if isinstance(data.get(k), str):
+                data[k] = datetime.fromisoformat(data[k])
+
+        key_updated_at = {
+            k: dt_util.parse_datetime(v) for k, v in snapshot.get("updated_at", {}).items()
+        }
+        # too old to be worth showing
+        if not key_updated_at or dt_util.utcnow() - max(key_updated_at.values()) > self._max_staleness:
+            return False
+
+        self.data = data
+        self.key_updated_at = key_updated_at
+        self.stale = True
+        return True
+
+    def _get_snapshot(self):
+        return {
+            "data": self.data,
+            "updated_at": {k: v.isoformat() for k, v in self.key_updated_at.items()},
+        }
+
+    @callback
+    def _async_save_snapshot(self):
+        if self._snapshot_store is not None:
+            self._snapshot_store.async_delay_save(self._get_snapshot, SNAPSHOT_SAVE_DELAY)
+
+    def _merge_data(self, data):
+        """New snapshot: the previous one updated with the non None values of data.
+
+        Values are shared with the previous snapshot, not copied: they are never modified in place.
+        """
+        merged = dict(self.data) if self.data is not None else {}
+        for k, v in data.items():
+            if v is not None:
+                merged[k] = v
+        return merged
+
+    def _get_changed_keys(self, data):
+        if self.data is None or data is None:
+            return None
+        return {k for k in self.data.keys() | data.keys() if self.data.get(k) != data.get(k)}
+
+    @callback
+    def async_set_updated_data(self, data) -> None:
+        """Publish data, only the entities whose keys changed are notified."""
+        self._changed_keys = self._get_changed_keys(data)
+        super().async_set_updated_data(data)
+
+    @callback
+    def async_update_listeners(self) -> None:
+        """Only notify the entities whose keys changed, or all of them when availability changed."""
+        changed_keys = self._changed_keys
+        self._changed_keys = None
+
+        state = (self.last_update_success, self.stale)
+        if changed_keys is None or state != self._last_notified_state:
+            self._last_notified_state = state
+            super().async_update_listeners()
+            return
+
+        for update_callback, context in list(self._listeners.values()):
+            if context is None or not context.keys.isdisjoint(changed_keys):
+                update_callback()
+
+    def _serve_stale(self, update_failed, exception, min_retry=timedelta(0)):
+        """Keep the last known data, flagged stale, while the refresh is retried with backoff.
+
+        Raise update_failed, making the entities unavailable, once the data is older than max_staleness.
+        """
+        self._failures += 1
+
+        backoff = min(STALE_RETRY_MAX, STALE_RETRY_MIN * (2 ** min(self._failures - 1, 10)))
+        self.update_interval = max(min_retry, backoff * random.uniform(0.8, 1.2))
+
+        if self.data is None or not self.key_updated_at:
+            raise update_failed from exception
+
+        last_read = max(self.key_updated_at.values())
+        if dt_util.utcnow() - last_read > self._max_staleness:
+            raise update_failed from exception
+
+        _LOGGER.warning("Hydrocapt refresh failed, serving data read at %s: %s", last_read, exception)
+        self.stale = True
+        self._changed_keys = set()
+        return self.data
+
+    def _get_statistics_importer(self):
+        pool_id = self.get_pool_id()
+        if pool_id is None or pool_id < 0:
+            return None
+        if self._statistics is None or self._statistics.pool_id != pool_id:
+            self._statistics = HydrocaptStatisticsImporter(self.hass, pool_id)
+        return self._statistics
+
+    def _async_import_statistics(self):
+        importer = self._get_statistics_importer()
+        if importer is None:
+            return
+        self.async_create_background_task(
+            self._async_run_statistics_import(importer, self.api.get_hourly_series()),
+            f"{DOMAIN} statistics import",
+        )
+
+    async def _async_run_statistics_import(self, importer, series):
+        try:
+            await importer.async_import(series)
+        except Exception as exception:
+            # the statistics are a bonus, never fail the refresh for them
+            _LOGGER.warning("Can't import the hourly measures into the statistics: %s", exception)
+
+    def _async_write_series_store(self):
+        pool_id = self.get_pool_id()
+        if self._closed or self._series_store_dir is None or pool_id is None or pool_id < 0:
+            return
+        job = self.hass.async_add_executor_job(self._write_series_store, pool_id, self.api.get_hourly_series())
+        self._series_store_jobs.add(job)
+        job.add_done_callback(self._series_store_jobs.discard)
+
+    def _write_series_store(self, pool_id, series):
+        if self._closed:
+            return
+        try:
+            path = os.path.join(self._series_store_dir, SERIES_STORE_FILE.format(pool_id=pool_id))
+            if self._series_store is None or self._series_store.path != path:
+                self.close_series_store()
+                self._series_store = HydrocaptSeriesStore(path)
+            self._series_store.append_series(series)
+        except Exception as exception:
+            _LOGGER.warning("Can't write the hourly measures to the local store: %s", exception)
+
+    def close_series_store(self):
+        """Blocking, to run in the executor."""
+        if self._series_store is not None:
+            self._series_store.close()
+            self._series_store = None
+
+    async def async_close(self):
+        """Stop the refreshes and the pending writes, and release the connections and files of the pool."""
+        self._closed = True
+        tasks = [task for task in self._background_tasks if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        if len(tasks) > 0:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        await self.async_shutdown()
+        self._timer_flush_tasks.clear()
+        # the websession was created for this entry only: close it with the client
+        await self.api.aclose(close_websession=True)
+
+        # a store write can't be cancelled once in the executor: let it end before closing the file
+        if len(self._series_store_jobs) > 0:
+            await asyncio.gather(*self._series_store_jobs, return_exceptions=True)
+        await self.hass.async_add_executor_job(self.close_series_store)
+
+    async def async_backfill_history(self, start, end, type_date, max_concurrent):
+        """Import past measures into the statistics, see HydrocaptHistoryBackfill."""
+        importer = self._get_statistics_importer()
+        if importer is None or self._backfill is None:
+            raise HomeAssistantError("Diffazur Hydrocapt pool not known yet, can't backfill its history")
+
+        # stopped by async_close like the other background work of the entry
+        task = self.async_create_background_task(
+            self._backfill.async_backfill(importer, start, end, type_date, max_concurrent, deadline=REFRESH_DEADLINE_S),
+            f"{DOMAIN} history backfill",
+        )
+        if task is None:
+            raise HomeAssistantError("Diffazur Hydrocapt entry unloaded, can't backfill its history")
+        try:
+            periods, failed, count = await task
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling() > 0:
+                raise
+            raise HomeAssistantError("Diffazur Hydrocapt entry unloaded during the history backfill")
+        _LOGGER.info("Backfilled %d statistics from %d %s periods, %d failed", count, periods, type_date, failed)
+        if failed > 0:
+            raise HomeAssistantError(f"{failed} of {periods} history periods failed, call the backfill again to resume")
+
     async def _async_update_data(self):
         """Fetch data from API endpoint."""
+        now = datetime.now()
+        tiers = self._get_due_tiers(now)
         try:
-            # id = await self.hass.async_add_executor_job(self.api._get_pool_internal_id)
-            data = await self.hass.async_add_executor_job(self.api.fetch_all_data)
+            # bounded well below the update interval so a refresh never overlaps the next one
+            data = await self.api.fetch_data(tiers, deadline=REFRESH_DEADLINE_S)
+        except HydrocaptCircuitOpenError as exception:
+            #the cloud kept failing: don't hammer it, the breaker lets a probe through once the cooldown is over
+            return self._serve_stale(
+                UpdateFailed(f"Hydrocapt cloud unavailable, next try in {exception.retry_in_s:.0f}s"),
+                exception,
+                timedelta(seconds=exception.retry_in_s),
+            )
+        except HydrocaptAuthError as exception:
+            return self._serve_stale(UpdateFailed(f"Hydrocapt authentication failed: {exception}"), exception)
         except Exception as exception:
-            raise UpdateFailed() from exception
+            return self._serve_stale(UpdateFailed(), exception)
+
+        self._failures = 0
 
         # data is the "new value" just remove None values from it to keep the old value
-        if self.data is not None:
-            new_data = copy.deepcopy(self.data)
-        else:
-            new_data = {}
+        new_data = self._merge_data(data)
 
+        now = datetime.now()
 
-        for k, v in data.items():
-            if v is not None:
-                new_data[k] = v
+        updated_at = dt_util.utcnow()
+        for tier in tiers:
+            for k in self.api.get_family_keys(tier):
+                self.key_updated_at[k] = updated_at
+
+        if TIER_COMMANDS in tiers:
+            self._tier_next_refresh[TIER_COMMANDS] = now + COMMANDS_REFRESH_INTERVAL
+        if TIER_SETPOINTS in tiers:
+            self._tier_next_refresh[TIER_SETPOINTS] = now + SETPOINTS_REFRESH_INTERVAL
+        if TIER_MEASURES in tiers:
+            self._scheduler.observe(data.get("date_time"), now)
+            self._tier_next_refresh[TIER_MEASURES] = now + self._scheduler.next_interval(now)
+            self._async_import_statistics()
+            self._async_write_series_store()
+
+        self.update_interval = max(SLOT_MIN_INTERVAL, min(self._tier_next_refresh.values()) - now)
+        self._changed_keys = self._get_changed_keys(new_data)
+        self.stale = False
 
-        return data
+        # the snapshot is built from self.data when written, once the new data is published
+        self._async_save_snapshot()
+
+        return new_data
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
@@ -172,10 +590,23 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     )
     if unloaded:
         hass.data[DOMAIN].pop(entry.entry_id)
+        await coordinator.async_close()
 
     return unloaded
 
 
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Forget the saved session and data when the entry is removed."""
+    await Store(hass, STORAGE_VERSION, SESSION_STORAGE_KEY.format(entry_id=entry.entry_id)).async_remove()
+    await Store(hass, STORAGE_VERSION, SNAPSHOT_STORAGE_KEY.format(entry_id=entry.entry_id)).async_remove()
+    await Store(hass, STORAGE_VERSION, BACKFILL_STORAGE_KEY.format(entry_id=entry.entry_id)).async_remove()
+
+    pool_id = entry.data.get(CONF_INTERNAL_POOL_ID, -1)
+    if pool_id is not None and pool_id >= 0:
+        path = hass.config.path(SERIES_STORE_DIR, SERIES_STORE_FILE.format(pool_id=pool_id))
+        await hass.async_add_executor_job(lambda: os.path.exists(path) and os.remove(path))
+
+
 async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """Reload config entry."""
     await async_unload_entry(hass, entry)
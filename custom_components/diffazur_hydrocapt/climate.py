@@ -62,6 +62,15 @@ class DiffazurHydrocaptClimateEntity(DiffazurHydrocaptEntity, ClimateEntity):
     _attr_min_temp = 5
     _enable_turn_on_off_backwards_compatibility = False
 
+    @property
+    def data_keys(self):
+        """Keys of the coordinator data this entity reads."""
+        return (
+            self.entity_description.heating_command,
+            self.entity_description.water_temperature,
+            self.entity_description.heating_setpoint,
+        )
+
     @property
     def hvac_mode(self):
         """Return hvac operation ie. heat, cool mode.
@@ -97,8 +106,7 @@ class DiffazurHydrocaptClimateEntity(DiffazurHydrocaptEntity, ClimateEntity):
             # _LOGGER.debug("%s: Setting temperature to %s", self.name, temperature)
             temp = round(temperature)
 
-            data = await self.hass.async_add_executor_job(
-                self.coordinator.set_consign,
+            data = await self.coordinator.set_consign(
                 self.entity_description.heating_setpoint,
                 temp,
             )
@@ -117,8 +125,7 @@ class DiffazurHydrocaptClimateEntity(DiffazurHydrocaptEntity, ClimateEntity):
             option = "Pool Heat AUTO"
 
         if option is not None:
-            data = await self.hass.async_add_executor_job(
-                self.coordinator.set_command_state,
+            data = await self.coordinator.set_command_state(
                 self.entity_description.heating_command,
                 option
             )
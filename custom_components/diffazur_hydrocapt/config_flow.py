@@ -1,16 +1,19 @@
 """Adds config flow for Diffazur hydrocapt."""
 from homeassistant import config_entries
 from homeassistant.core import callback
+from homeassistant.helpers.aiohttp_client import async_create_clientsession
 import voluptuous as vol
 
 from homeassistant.const import CONF_EMAIL, CONF_PASSWORD
 
 try:
-    from diffazur_hydrocapt.hydrocapt_lib.client import HydrocaptClient
+    from diffazur_hydrocapt.hydrocapt_lib.async_client import AsyncHydrocaptClient
 except Exception:
-    from .hydrocapt_lib.client import HydrocaptClient
+    from .hydrocapt_lib.async_client import AsyncHydrocaptClient
 
 from .const import DOMAIN, PLATFORMS, CONF_POOL_ID, CONF_INTERNAL_POOL_ID
+from .const import CONF_ALARMS_CACHE_TTL, DEFAULT_ALARMS_CACHE_TTL_MIN
+from .const import CONF_MAX_STALENESS, DEFAULT_MAX_STALENESS_MIN
 
 
 class DiffazurHydrocaptFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
@@ -80,14 +83,17 @@ class DiffazurHydrocaptFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
 
     async def _test_credentials(self, username, password, pool_id, internal_pool_id):
         """Return true if credentials is valid."""
+        websession = async_create_clientsession(self.hass)
         try:
-            client = HydrocaptClient(username, password, pool_id, internal_pool_id)
-            conn_status = await self.hass.async_add_executor_job(
-                client.is_connection_ok
+            client = AsyncHydrocaptClient(
+                username, password, pool_id, internal_pool_id, websession=websession
             )
+            conn_status = await client.is_connection_ok()
             return conn_status
         except Exception:
             pass
+        finally:
+            await websession.close()
 
         return False
 
@@ -114,8 +120,18 @@ class DiffazurHydrocaptOptionsFlowHandler(config_entries.OptionsFlow):
             step_id="user",
             data_schema=vol.Schema(
                 {
-                    vol.Required(x, default=self.options.get(x, True)): bool
-                    for x in sorted(PLATFORMS)
+                    **{
+                        vol.Required(x, default=self.options.get(x, True)): bool
+                        for x in sorted(PLATFORMS)
+                    },
+                    vol.Required(
+                        CONF_ALARMS_CACHE_TTL,
+                        default=self.options.get(CONF_ALARMS_CACHE_TTL, DEFAULT_ALARMS_CACHE_TTL_MIN),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=0)),
+                    vol.Required(
+                        CONF_MAX_STALENESS,
+                        default=self.options.get(CONF_MAX_STALENESS, DEFAULT_MAX_STALENESS_MIN),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=0)),
                 }
             ),
         )
@@ -1,4 +1,6 @@
 """Constants for Diffazur Hydrocapt."""
+from datetime import timedelta
+
 # Base component constants
 
 PREFIX = "Pool"
@@ -29,9 +31,75 @@ PLATFORMS = [BINARY_SENSOR, SENSOR, LIGHT, SELECT, SWITCH, CLIMATE]
 
 CONF_POOL_ID = "pool id"
 CONF_INTERNAL_POOL_ID = "internal pool id"
+CONF_ALARMS_CACHE_TTL = "alarms_cache_ttl"
+CONF_MAX_STALENESS = "max_staleness"
 
 # Defaults
 DEFAULT_NAME = DOMAIN
+# alarm thresholds are read again only after this many minutes, unless refreshed with the service
+DEFAULT_ALARMS_CACHE_TTL_MIN = 360
+# last known values are still served, flagged stale, this many minutes after refreshes started failing
+DEFAULT_MAX_STALENESS_MIN = 180
+
+# Deadlines (seconds) bounding a whole refresh / a whole write and its confirmation
+REFRESH_DEADLINE_S = 120
+WRITE_DEADLINE_S = 60
+
+# Refresh tiers: each data family is refreshed at its own pace, entities only listen to the tier they read
+TIER_COMMANDS = "commands"
+TIER_MEASURES = "measures"
+TIER_SETPOINTS = "setpoints"
+TIERS = [TIER_COMMANDS, TIER_MEASURES, TIER_SETPOINTS]
+# commands can be changed from the pool panel, setpoints and timers hardly ever change, measures follow the hourly slots
+COMMANDS_REFRESH_INTERVAL = timedelta(minutes=5)
+SETPOINTS_REFRESH_INTERVAL = timedelta(hours=6)
+# tiers due within this delay are refreshed together
+TIER_GROUPING = timedelta(seconds=30)
+# retries while serving stale data, doubled after each failure
+STALE_RETRY_MIN = timedelta(minutes=1)
+STALE_RETRY_MAX = timedelta(minutes=15)
+
+# Refresh scheduling: the cloud publishes one measure slot per hour, some time after the hour
+SLOT_PERIOD = timedelta(hours=1)
+SLOT_DEFAULT_LAG = timedelta(minutes=5)
+SLOT_MARGIN = timedelta(minutes=1)
+SLOT_BACKOFF_MIN = timedelta(minutes=2)
+SLOT_BACKOFF_MAX = timedelta(minutes=30)
+SLOT_MIN_INTERVAL = timedelta(minutes=1)
+
+# Services
+SERVICE_SET_COMMAND_STATES = "set_command_states"
+SERVICE_REFRESH_ALARM_THRESHOLDS = "refresh_alarm_thresholds"
+SERVICE_BACKFILL_HISTORY = "backfill_history"
+ATTR_COMMANDS = "commands"
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+ATTR_START_DATE = "start_date"
+ATTR_END_DATE = "end_date"
+ATTR_TYPE_DATE = "type_date"
+ATTR_MAX_CONCURRENT = "max_concurrent"
+
+# Storage
+STORAGE_VERSION = 1
+SESSION_STORAGE_KEY = f"{DOMAIN}.{{entry_id}}.session"
+SESSION_SAVE_DELAY = 5
+# last good data, to start from it instead of waiting for the cloud
+SNAPSHOT_STORAGE_KEY = f"{DOMAIN}.{{entry_id}}.snapshot"
+SNAPSHOT_SAVE_DELAY = 30
+# data keys holding a datetime, stored as iso strings
+SNAPSHOT_DATETIME_KEYS = ["date_time"]
+
+# Long term statistics: the hourly measures imported as external statistics
+STATISTICS_MEASURES = ["water_temperature", "technical_room_temperature", "ph", "conductivity", "redox"]
+# history backfill: periods already imported, so an interrupted backfill resumes where it stopped
+BACKFILL_STORAGE_KEY = f"{DOMAIN}.{{entry_id}}.backfill"
+BACKFILL_SAVE_DELAY = 5
+BACKFILL_TYPE_DATES = ["day", "week", "month"]
+DEFAULT_BACKFILL_TYPE_DATE = "week"
+DEFAULT_BACKFILL_MAX_CONCURRENT = 2
+MAX_BACKFILL_MAX_CONCURRENT = 4
+# local series store of each pool, under the configuration directory
+SERIES_STORE_DIR = DOMAIN
+SERIES_STORE_FILE = "{pool_id}.hcts"
 
 
 STARTUP_MESSAGE = f"""
@@ -1,4 +1,6 @@
 """DiffazurHydrocaptEntity class"""
+from typing import FrozenSet, NamedTuple
+
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.helpers.entity import DeviceInfo, EntityDescription
 from homeassistant.helpers.update_coordinator import (
@@ -9,31 +11,43 @@ from homeassistant.helpers.update_coordinator import (
 
 from homeassistant.util import dt as dt_util, ensure_unique_string, slugify
 
-from .const import DOMAIN, NAME, VERSION, ATTRIBUTION, MANUFACTURER
+from .const import ATTRIBUTION
+
+
+class DiffazurHydrocaptListenContext(NamedTuple):
+    """What an entity reads from the coordinator data, it is only notified when one of its keys changed."""
+
+    keys: FrozenSet[str]
 
 
 class DiffazurHydrocaptEntity(CoordinatorEntity):
 
     _attr_attribution = ATTRIBUTION
+
     def __init__(self, coordinator: DataUpdateCoordinator, description: EntityDescription):
-        super().__init__(coordinator)
         self.entity_description  = description
+        super().__init__(coordinator, context=DiffazurHydrocaptListenContext(frozenset(self.data_keys)))
+
+        # the pool id is resolved at setup: computed once here, properties never reach the coordinator
+        pool_id = coordinator.get_pool_id()
+        self._attr_device_info = coordinator.device_info
+        self._attr_unique_id = slugify(f"{description.name} {type(self).__name__} {pool_id}")
 
     @property
-    def device_info(self):
-        pool_id = self.coordinator.get_pool_id()
-        return {
-            "identifiers": {(DOMAIN, pool_id)},
-            "name": f"{NAME} (pool id: {pool_id})",
-            "model": VERSION,
-            "manufacturer": MANUFACTURER,
-        }
+    def data_keys(self):
+        """Keys of the coordinator data this entity reads."""
+        return (self.entity_description.key,)
 
     @property
-    def unique_id(self) -> str:
-        """Return unique id for car entity."""
-        pool_id = self.coordinator.get_pool_id()
-        return slugify(f"{self.entity_description.name} {type(self).__name__} {pool_id}")
+    def extra_state_attributes(self):
+        """Flag values not confirmed by the latest refresh, and tell when they were read from the cloud."""
+        updated_at = [
+            self.coordinator.key_updated_at[k] for k in self.data_keys if k in self.coordinator.key_updated_at
+        ]
+        return {
+            "stale": self.coordinator.stale,
+            "last_read": min(updated_at) if updated_at else None,
+        }
 
 
     # @property
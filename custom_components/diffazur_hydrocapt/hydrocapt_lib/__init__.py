@@ -1,5 +1,5 @@
-
 """Diffazur Hydrocapt REST Client."""
 from .client import HydrocaptClient
+from .async_client import AsyncHydrocaptClient
 
-__all__ = ["HydrocaptClient"]
+__all__ = ["HydrocaptClient", "AsyncHydrocaptClient"]
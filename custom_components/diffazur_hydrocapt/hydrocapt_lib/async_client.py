@@ -0,0 +1,757 @@
+# -*- coding: utf-8 -*-
+"""Asyncio client for the Diffazur Hydrocapt API."""
+import asyncio
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import aiohttp
+from aiohttp import ClientSession
+
+from datetime import datetime
+
+from .client import HydrocaptClientBase
+from .client import NUM_CHECK_COMMANDS, WAIT_BETWEEN_CHACK_S
+from .async_session import AsyncHydrocaptClientSession
+from .exceptions import HydrocaptError, HydrocaptDeadlineError, HydrocaptServerError, HydrocaptProtocolError, HydrocaptClosedError
+from .deadline import HydrocaptDeadline
+from .history import parse_history_arrays
+from .retry import HydrocaptCircuitBreaker
+from .retry import HYDROCAPT_READ_RETRY_POLICIES, HYDROCAPT_WRITE_RETRY_POLICIES, get_retry_policy
+
+from .const import HYDROCAPT_GET_POOL_COMMAND_URL
+from .const import HYDROCAPT_SAVE_POOL_COMMAND_URL
+from .const import HYDROCAPT_POOL_LIST_OWN_URL
+from .const import HYDROCAPT_AJAX_POOL_HISTORIC
+from .const import HYDROCAPT_GET_ALARMS_URL
+from .const import HYDROCAPT_GET_POOL_CONSIGN_URL
+from .const import HYDROCAPT_SAVE_POOL_CONSIGN_URL
+from .const import HYDROCAPT_DEFAULT_MAX_CONCURRENT_REQUESTS
+from .const import HYDROCAPT_DEFAULT_TIMER_COALESCE_WINDOW_S
+from .const import HYDROCAPT_DEFAULT_ALARMS_CACHE_TTL_S
+from .const import HYDROCAPT_FAMILY_COMMANDS, HYDROCAPT_FAMILY_MEASURES, HYDROCAPT_FAMILY_SETPOINTS, HYDROCAPT_FAMILIES
+
+
+class AsyncHydrocaptClient(HydrocaptClientBase):
+    """Asyncio proxy to the Hydrocapt REST API, to be awaited directly from an event loop.
+
+    fetch_all_data and the set_* calls accept a deadline (seconds or a HydrocaptDeadline): when it runs
+    out, every request and confirmation wait still in flight for that call is cancelled.
+
+    The set_* calls return once the write is accepted when wait_confirm is False: the saved state is
+    updated optimistically and the confirmation keeps polling in a task, see get_confirm_task.
+    """
+
+    def __init__(self, username: str, password: str, pool_id: Optional[int] = -1, pool_internal_id: Optional[int] = -1, websession: Optional[ClientSession] = None, max_concurrent_requests: int = HYDROCAPT_DEFAULT_MAX_CONCURRENT_REQUESTS, on_login: Optional[Callable[[Dict[str, Any]], None]] = None, timeouts: Optional[Dict[str, Any]] = None, circuit_breaker: Optional[HydrocaptCircuitBreaker] = None, timer_coalesce_window_s: float = HYDROCAPT_DEFAULT_TIMER_COALESCE_WINDOW_S, alarms_cache_ttl_s: float = HYDROCAPT_DEFAULT_ALARMS_CACHE_TTL_S) -> None:
+        """Initialize the API, authentication is done on the first request.
+
+        Args:
+            username: string containing your Hydrocapt's app username
+            password: string containing your Hydrocapt's app password
+            websession: aiohttp session dedicated to this client (it holds the auth cookies)
+            max_concurrent_requests: max number of requests in flight when fetching concurrently
+            on_login: called with the new auth state after each login, to persist it (see restore_auth_state)
+            timeouts: per endpoint (connect, read) timeouts overriding HYDROCAPT_DEFAULT_TIMEOUTS
+            circuit_breaker: shared breaker stopping calls during a cloud outage, one is created if not given
+            timer_coalesce_window_s: quiet time after the last queue_consign_timer_hour edit of a timer before it is saved
+            alarms_cache_ttl_s: how long the alarm thresholds are reused before being read again, 0 to never cache them
+        """
+        super().__init__(username, password, pool_id=pool_id, pool_internal_id=pool_internal_id, circuit_breaker=circuit_breaker, alarms_cache_ttl_s=alarms_cache_ttl_s)
+        self._websession = websession
+        #only a websession created here is closed by aclose by default
+        self._owns_websession = websession is None
+        self._request_semaphore = asyncio.Semaphore(max(1, max_concurrent_requests))
+        self._on_login = on_login
+        self._timeouts = timeouts
+        self.session: Optional[AsyncHydrocaptClientSession] = None
+        #pending write confirmations, by command or consign name
+        self._confirm_tasks: Dict[str, asyncio.Task] = {}
+        #queued timer hour edits by consign, the last value of an hour wins
+        self._timer_coalesce_window_s = timer_coalesce_window_s
+        self._pending_timer_edits: Dict[str, Dict[int, bool]] = {}
+        self._timer_last_edit: Dict[str, float] = {}
+        self._timer_flush_tasks: Dict[str, asyncio.Task] = {}
+        #set by aclose: no new session, websession or background task after it
+        self._closed = False
+
+    def _check_open(self):
+        if self._closed:
+            raise HydrocaptClosedError("Hydrocapt client is closed")
+
+    def _get_session(self) -> AsyncHydrocaptClientSession:
+        self._check_open()
+
+        if self._websession is None:
+            self._websession = aiohttp.ClientSession()
+            self._owns_websession = True
+
+        #one session for the client lifetime: it serializes the re-authentications
+        if self.session is None:
+            self.session = AsyncHydrocaptClientSession(
+                self.username,
+                self.password,
+                self.pool_internal_id,
+                websession=self._websession,
+                request_semaphore=self._request_semaphore,
+                on_login=self._on_login,
+                timeouts=self._timeouts,
+            )
+
+        return self.session
+
+    async def aclose(self, close_websession: Optional[bool] = None):
+        """Stop the background work and release the connections.
+
+        The pending write confirmations and timer saves are cancelled, queued timer edits not saved yet are
+        dropped: the cloud keeps the last accepted values.
+
+        Any later call raises HydrocaptClosedError instead of opening a new session.
+
+        Args:
+            close_websession: close the aiohttp session, by default only when it was created by the client
+        """
+        self._closed = True
+
+        tasks = list(set(self._confirm_tasks.values())) + list(self._timer_flush_tasks.values())
+        for task in tasks:
+            task.cancel()
+        if len(tasks) > 0:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self._confirm_tasks.clear()
+        self._timer_flush_tasks.clear()
+        self._pending_timer_edits.clear()
+        self._timer_last_edit.clear()
+
+        if self.session is not None:
+            await self.session.aclose()
+            self.session = None
+
+        if close_websession is None:
+            close_websession = self._owns_websession
+
+        websession = self._websession
+        if close_websession and websession is not None:
+            self._websession = None
+            if not websession.closed:
+                await websession.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    def get_auth_state(self) -> Dict[str, Any]:
+        """Return the current session cookies and pool id, to be saved and given back to restore_auth_state."""
+        return self._get_session().get_auth_state()
+
+    def restore_auth_state(self, auth_state: Dict[str, Any]):
+        """Reuse saved session cookies and pool id instead of login (and pool discovery) again.
+
+        The restored session is checked with one cheap request before use, a login is done only if it is stale.
+        """
+        if auth_state is None:
+            return
+
+        pool_internal_id = auth_state.get("pool_internal_id", -1)
+        if self.pool_internal_id < 0 and pool_internal_id is not None and pool_internal_id >= 0:
+            self.pool_internal_id = pool_internal_id
+
+        self._get_session().restore_auth_state(auth_state)
+
+    async def _get_pool_internal_id(self):
+        if self.pool_internal_id < 0:
+            session = self._get_session()
+            self.pool_internal_id = await session.get_internal_pool_id()
+        return self.pool_internal_id
+
+    async def get_pool_id(self):
+        return await self._get_pool_internal_id()
+
+    async def get_pool_serials(self, deadline=None) -> List[int]:
+        """Internal ids of all the pools of the account."""
+        return await self._run_with_deadline(self._call_with_retry(self._get_session().get_pool_serials), deadline)
+
+    async def is_connection_ok(self):
+        session = self._get_session()
+        if session is None:
+            return False
+
+        if await session.is_connection_ok() is False:
+            return False
+
+        pool_id = await self._get_pool_internal_id()
+        if  pool_id < 0:
+            return False
+
+        return True
+
+    async def _run_with_deadline(self, coro, deadline):
+        """Await coro, cancelling it (and all it awaits) when the deadline runs out."""
+        remaining = HydrocaptDeadline.of(deadline).remaining()
+        try:
+            async with asyncio.timeout(remaining):
+                return await coro
+        except TimeoutError as exc:
+            raise HydrocaptDeadlineError("Hydrocapt deadline exceeded") from exc
+
+    async def _gather(self, *aws):
+        """Run independent requests concurrently, raise the first failure once all are done."""
+        results = await asyncio.gather(*aws, return_exceptions=True)
+        for r in results:
+            if isinstance(r, BaseException):
+                raise r
+        return results
+
+    async def _call_with_retry(self, func, *args, policies=HYDROCAPT_READ_RETRY_POLICIES):
+        """Await func(*args), retrying according to the policy of the error class raised.
+
+        Network and server failures feed the circuit breaker, which fails fast while the cloud is down.
+        """
+        attempt = 0
+        relogin_from = None
+        while True:
+            trial = self.circuit_breaker.before_call()
+            try:
+                session = self._get_session()
+                login_generation = session.login_generation
+                try:
+                    if relogin_from is not None:
+                        await session.relogin(relogin_from)
+                        relogin_from = None
+                        login_generation = session.login_generation
+                    ret = await func(*args)
+                except HydrocaptError as exc:
+                    self.circuit_breaker.record_failure(exc)
+                    attempt += 1
+                    policy = get_retry_policy(exc, policies)
+                    if attempt >= policy.max_attempts:
+                        raise
+                    if policy.relogin:
+                        relogin_from = login_generation
+                    await asyncio.sleep(policy.get_delay(attempt))
+                    continue
+
+                self.circuit_breaker.record_success()
+                return ret
+            finally:
+                #a trial cancelled by the deadline or the unload must not keep the circuit open
+                self.circuit_breaker.release_trial(trial)
+
+    async def _get_pool_history(self, pool_id, today, type_date="day", allow_empty=False):
+
+        get_pool_data_url = self._get_pool_history_url(pool_id, today, type_date)
+
+        content = await self._get_session().get(get_pool_data_url)
+
+        return self._check_pool_history(self._decode_json(content), allow_empty=allow_empty)
+
+    async def _get_alarms(self, pool_id):
+
+        #they rarely change, read them only when the cache expired
+        alarms = self._get_cached_alarms()
+        if alarms is not None:
+            return alarms
+
+        get_alarms_data = {"serial":pool_id}
+
+        result_get_alarms = await self._get_session().post(
+            HYDROCAPT_GET_ALARMS_URL,
+            data=get_alarms_data,
+            headers=dict(referer=f"{HYDROCAPT_AJAX_POOL_HISTORIC}?serial={pool_id}")
+        )
+
+        tree_alarms = self._check_xml_not_authenticated(result_get_alarms)
+
+        alarms = self._parse_alarms(tree_alarms)
+        self._cache_alarms(alarms)
+
+        return alarms
+
+    async def _get_pool_measure_latest(self) -> Dict[str, Any]:
+        """Retrieve most recents measures, see HydrocaptClient._get_pool_measure_latest for the returned keys.
+
+        Raises:
+            HydrocaptError: when hydrocapt API returns an incorrect response
+        """
+        pool_id = await self._get_pool_internal_id()
+        if pool_id < 0:
+            raise HydrocaptProtocolError("can't get pool id in measure")
+
+        today = datetime.today().strftime('%Y-%m-%d')
+
+        #history and limits are independent: fetch both at once
+        a, alarms = await self._gather(
+            self._get_pool_history(pool_id, today),
+            self._get_alarms(pool_id),
+        )
+
+        arrays = parse_history_arrays(a, today)
+        cur_data = self._parse_pool_history(a, today, arrays)
+        self._saved_series = self._parse_pool_history_series(a, today, arrays)
+
+        return self._apply_alarms(cur_data, alarms)
+
+
+    async def get_pool_measure_latest(self) -> Dict[str, Any]:
+
+        read_data = await self._call_with_retry(self._get_pool_measure_latest)
+
+        self._saved_read_values = read_data
+
+        return read_data
+
+
+    async def _get_pool_history_series(self, date, type_date):
+
+        pool_id = await self._get_pool_internal_id()
+        if pool_id < 0:
+            raise HydrocaptProtocolError("can't get pool id in history")
+
+        date = self._get_history_date(date)
+        a = await self._get_pool_history(pool_id, date, type_date, allow_empty=True)
+        if self._is_pool_history_empty(a):
+            return {}
+
+        return self._parse_pool_history_series(a, date)
+
+    async def get_pool_history_series(self, date, type_date="day", deadline=None) -> Dict[str, List[Tuple[datetime, float]]]:
+        """Read a past period of measures, see HydrocaptClient.get_pool_history_series.
+
+        Several periods can be read at once, the requests in flight stay bounded by max_concurrent_requests.
+        """
+        return await self._run_with_deadline(
+            self._call_with_retry(self._get_pool_history_series, date, type_date), deadline
+        )
+
+    async def _get_commands_current_states(self) -> Dict[str, Any]:
+
+        pool_id = await self._get_pool_internal_id()
+
+        get_pool_command_url = f"{HYDROCAPT_GET_POOL_COMMAND_URL}?serial={pool_id}"
+
+        commands_state = await self._get_session().get(get_pool_command_url)
+
+        tree_cmd_state = self._check_xml_not_authenticated(commands_state)
+
+        return self._parse_commands_states(tree_cmd_state)
+
+    async def get_commands_current_states(self) -> Dict[str, Any]:
+
+        states = await self._call_with_retry(self._get_commands_current_states)
+
+        #a refresh during a write confirmation keeps showing the written states
+        self._saved_states = self._keep_pending_writes(states, self._saved_states)
+
+        return states
+
+
+    async def _set_command_states(self, commands):
+
+        pool_id = await self._get_pool_internal_id()
+        if pool_id is None or pool_id < 0:
+            raise HydrocaptProtocolError("Can't get pool id")
+
+        save_internal_commands = self._get_hydrocapt_internal_command_states_from_external(commands)
+        save_internal_commands["serial"] = pool_id
+
+        result_save = await self._get_session().post(
+            HYDROCAPT_SAVE_POOL_COMMAND_URL,
+            data=save_internal_commands,
+            headers=dict(referer=HYDROCAPT_POOL_LIST_OWN_URL)
+        )
+
+        return self._check_command_consign_result_save(result_save)
+
+    async def _confirm_command_states(self, commands):
+
+        # wait for change to happen, without holding anything but this coroutine
+        # one read checks all the commands of the batch, the optimistic states stay until it matches
+        for i in range(NUM_CHECK_COMMANDS):
+            cur_states = await self._call_with_retry(self._get_commands_current_states)
+            if all(cur_states.get(command) == state for command, state in commands.items()):
+                self._saved_states = self._keep_pending_writes(cur_states, self._saved_states)
+                return cur_states
+            await asyncio.sleep(WAIT_BETWEEN_CHACK_S)
+
+        #not applied: show what the cloud really has
+        self._saved_states = self._keep_pending_writes(cur_states, self._saved_states)
+        raise HydrocaptServerError("Cannot save command state")
+
+
+    async def set_command_state(self, command, state, get_prev=False, deadline=None, wait_confirm=True):
+        """Write a command state.
+
+        Args:
+            get_prev: read the current state first, it is returned
+            deadline: budget for the write and its confirmation
+            wait_confirm: False to return once the write is accepted, the confirmation runs in get_confirm_task(command)
+        """
+        prev_states = await self.set_command_states({command: state}, get_prev=get_prev, deadline=deadline, wait_confirm=wait_confirm)
+        return prev_states.get(command)
+
+    async def set_command_states(self, commands: Dict[str, str], get_prev=False, deadline=None, wait_confirm=True) -> Dict[str, Any]:
+        """Write several command states in a single save request, confirmed by a single read.
+
+        Args:
+            commands: new state by command name, see get_commands_and_options
+            get_prev: read the current states first, they are returned
+            deadline: budget for the write and its confirmation
+            wait_confirm: False to return once the write is accepted, the confirmation runs in
+                get_confirm_task(command) of each command
+
+        Returns:
+            The previous state of each command if get_prev, an empty dict otherwise
+        """
+        deadline = HydrocaptDeadline.of(deadline)
+
+        prev_states, accepted = await self._run_with_deadline(self._set_command_states_with_retry(commands, get_prev=get_prev), deadline)
+        if accepted is None:
+            #No change
+            return prev_states
+
+        #optimistic, reconciled by the confirmation reads
+        self._saved_states = {**self._saved_states, **commands}
+
+        task = self._start_confirm(list(commands), self._confirm_command_states(dict(commands)), deadline)
+        if wait_confirm is True:
+            await task
+
+        return prev_states
+
+    async def _set_command_states_with_retry(self, commands, get_prev=False):
+
+        prev_states = {}
+
+        if get_prev is True:
+            curr_states = await self.get_commands_current_states()
+            prev_states = {command: curr_states.get(command) for command in commands}
+
+        accepted = await self._call_with_retry(self._set_command_states, commands, policies=HYDROCAPT_WRITE_RETRY_POLICIES)
+
+        return prev_states, accepted
+
+
+    async def _set_consign(self, consign, value):
+
+        pool_id = await self._get_pool_internal_id()
+        if pool_id is None or pool_id < 0:
+            raise HydrocaptProtocolError("Can't get pool id")
+
+        external_consigns = {consign:value}
+        save_internal_consigns = self._get_hydrocapt_internal_consigns_from_external(external_consigns)
+        save_internal_consigns["serial"] = pool_id
+
+        result_save = await self._get_session().post(
+            HYDROCAPT_SAVE_POOL_CONSIGN_URL,
+            data=save_internal_consigns,
+            headers=dict(referer=HYDROCAPT_POOL_LIST_OWN_URL)
+        )
+
+        return self._check_command_consign_result_save(result_save)
+
+    async def _confirm_consign(self, consign, value):
+
+        # wait for change to happen, the optimistic value stays until it matches
+        for i in range(NUM_CHECK_COMMANDS):
+            cur_consigns = await self._call_with_retry(self._get_current_consigns)
+            if cur_consigns.get(consign) == value:
+                self._save_consigns(cur_consigns)
+                return cur_consigns
+            await asyncio.sleep(WAIT_BETWEEN_CHACK_S)
+
+        #not applied: show what the cloud really has
+        self._save_consigns(cur_consigns)
+        raise HydrocaptServerError("Cannot save consign")
+
+
+    async def set_consign(self, consign, value, get_prev=False, deadline=None, wait_confirm=True):
+        """Write a consign, see set_command_state for the arguments."""
+        deadline = HydrocaptDeadline.of(deadline)
+
+        prev_value, accepted = await self._run_with_deadline(self._set_consign_with_retry(consign, value, get_prev=get_prev), deadline)
+        if accepted is None:
+            #No change
+            return prev_value
+
+        return await self._confirm_consign_write(consign, value, prev_value, deadline, wait_confirm)
+
+    async def _set_consign_with_retry(self, consign, value, get_prev=False):
+
+        prev_value = None
+
+        if get_prev is True:
+            cur_consigns = await self.get_current_consigns()
+            prev_value = cur_consigns.get(consign)
+
+        accepted = await self._call_with_retry(self._set_consign, consign, value, policies=HYDROCAPT_WRITE_RETRY_POLICIES)
+
+        return prev_value, accepted
+
+    async def _confirm_consign_write(self, consign, value, prev_value, deadline, wait_confirm):
+
+        #optimistic, reconciled by the confirmation reads
+        shown = value
+        hours = self._pending_timer_edits.get(consign)
+        if hours:
+            #hour edits queued while the save was in flight stay shown until their own flush
+            shown = list(value)
+            for hour_idx, hour_value in hours.items():
+                shown[hour_idx] = hour_value
+        self._saved_consigns = {**self._saved_consigns, consign: shown}
+
+        task = self._start_confirm([consign], self._confirm_consign(consign, value), deadline)
+        if wait_confirm is True:
+            await task
+
+        return prev_value
+
+    async def set_consign_timer_hour(self, consign, hour_idx, value, deadline=None, wait_confirm=True):
+        """Switch one hour of a timer consign, see set_command_state for the arguments."""
+        deadline = HydrocaptDeadline.of(deadline)
+
+        cur_timer = await self._run_with_deadline(self._set_consign_timer_hour(consign, hour_idx, value), deadline)
+        if cur_timer is None:
+            return
+
+        await self._confirm_consign_write(consign, cur_timer, None, deadline, wait_confirm)
+
+    async def _set_consign_timer_hour(self, consign, hour_idx, value):
+
+        if self._is_timer_hour_edit_valid(consign, hour_idx) is False:
+            return None
+
+        if self._saved_consigns.get(consign) is None:
+            await self.get_current_consigns()
+
+        cur_timer = self._get_edited_timer(consign, hour_idx, value)
+
+        if cur_timer is None:
+            return None
+
+        prev_value, accepted = await self._set_consign_with_retry(consign, cur_timer)
+        if accepted is None:
+            return None
+
+        return cur_timer
+
+    async def queue_consign_timer_hour(self, consign, hour_idx, value, deadline=None) -> Optional[asyncio.Task]:
+        """Queue one hour of a timer consign, edits of the same timer are saved together.
+
+        The saved timer is updated optimistically at once. The whole timer is saved in one request when
+        no other edit of it was queued for timer_coalesce_window_s, an hour edited several times is sent
+        with its last value only.
+
+        Args:
+            deadline: budget for the save and its confirmation, counted from the flush
+
+        Returns:
+            The flush task, done once the save is accepted (its confirmation is then in get_confirm_task(consign)),
+            None if the edit is not valid
+        """
+        self._check_open()
+
+        if self._is_timer_hour_edit_valid(consign, hour_idx) is False:
+            return None
+
+        if self._saved_consigns.get(consign) is None:
+            await self.get_current_consigns()
+
+        self._pending_timer_edits.setdefault(consign, {})[hour_idx] = value
+        self._timer_last_edit[consign] = asyncio.get_running_loop().time()
+
+        #optimistic, get_current_consigns overlays the queued edits until the flush
+        self._saved_consigns = {**self._saved_consigns, consign: self._get_edited_timer(consign, hour_idx, value)}
+
+        task = self._timer_flush_tasks.get(consign)
+        if task is None or task.done():
+            task = asyncio.create_task(self._flush_timer_edits_later(consign, deadline))
+            self._timer_flush_tasks[consign] = task
+
+        return task
+
+    async def _flush_timer_edits_later(self, consign, deadline):
+
+        loop = asyncio.get_running_loop()
+
+        #debounce: wait until the timer was left alone for a whole window
+        while True:
+            wait_s = self._timer_last_edit[consign] + self._timer_coalesce_window_s - loop.time()
+            if wait_s <= 0:
+                break
+            await asyncio.sleep(wait_s)
+
+        return await self.flush_timer_edits(consign, deadline=deadline)
+
+    async def flush_timer_edits(self, consign, deadline=None):
+        """Save the queued hour edits of a timer now, in a single setpoint save."""
+        hours = self._pending_timer_edits.pop(consign, None)
+        self._timer_last_edit.pop(consign, None)
+        if self._timer_flush_tasks.get(consign) is not asyncio.current_task():
+            task = self._timer_flush_tasks.pop(consign, None)
+            if task is not None:
+                task.cancel()
+        else:
+            del self._timer_flush_tasks[consign]
+
+        if not hours:
+            return None
+
+        deadline = HydrocaptDeadline.of(deadline)
+
+        cur_timer = await self._run_with_deadline(self._get_timer_to_flush(consign, hours), deadline)
+        if cur_timer is None:
+            return None
+
+        prev_value, accepted = await self._run_with_deadline(self._set_consign_with_retry(consign, cur_timer), deadline)
+        if accepted is None:
+            #No change
+            return None
+
+        return await self._confirm_consign_write(consign, cur_timer, None, deadline, wait_confirm=False)
+
+    async def _get_timer_to_flush(self, consign, hours):
+
+        if self._saved_consigns.get(consign) is None:
+            await self.get_current_consigns()
+
+        return self._get_edited_timer_hours(consign, hours)
+
+    def _start_confirm(self, keys, coro, deadline) -> asyncio.Task:
+        #a newer write of the same keys makes the previous confirmation pointless,
+        #unless it still confirms other keys of its batch
+        for key in keys:
+            prev_task = self._confirm_tasks.get(key)
+            if prev_task is None or prev_task.done():
+                continue
+            prev_keys = [k for k, t in self._confirm_tasks.items() if t is prev_task]
+            if set(prev_keys) <= set(keys):
+                prev_task.cancel()
+
+        task = asyncio.create_task(self._run_with_deadline(coro, deadline))
+        for key in keys:
+            self._confirm_tasks[key] = task
+
+        def _forget(t):
+            for key in keys:
+                if self._confirm_tasks.get(key) is t:
+                    del self._confirm_tasks[key]
+            #the failure is kept in the task for whoever awaits it, don't warn when nobody does
+            if not t.cancelled():
+                t.exception()
+
+        task.add_done_callback(_forget)
+        return task
+
+    def _keep_pending_writes(self, states, saved):
+        """Keep the optimistic value of the keys another confirmation is still waiting for."""
+        current = asyncio.current_task()
+        pending = {
+            key: saved[key] for key, task in self._confirm_tasks.items()
+            if task is not current and not task.done() and key in states and key in saved
+        }
+        if len(pending) == 0:
+            return states
+        return {**states, **pending}
+
+    def get_confirm_task(self, key) -> Optional[asyncio.Task]:
+        """Return the pending confirmation of the last write of a command or consign, None if there is none.
+
+        The task result is the state read back, it raises if the write could not be confirmed.
+        """
+        return self._confirm_tasks.get(key)
+
+
+    async def _get_current_consigns(self) -> Dict[str, Any]:
+
+        pool_id = await self._get_pool_internal_id()
+
+        get_pool_command_url = f"{HYDROCAPT_GET_POOL_CONSIGN_URL}?serial={pool_id}"
+
+        commands_state = await self._get_session().get(get_pool_command_url)
+
+        tree_consign_state = self._check_xml_not_authenticated(commands_state)
+
+        return self._parse_consigns(tree_consign_state)
+
+    async def get_current_consigns(self) -> Dict[str, Any]:
+
+        states = await self._call_with_retry(self._get_current_consigns)
+
+        self._save_consigns(states)
+
+        return states
+
+    def _save_consigns(self, states):
+
+        #keep showing the consigns still being confirmed and the timer edits still waiting for their flush
+        saved = self._keep_pending_writes(states, self._saved_consigns)
+        for consign, hours in self._pending_timer_edits.items():
+            if states.get(consign) is not None:
+                if saved is states:
+                    saved = dict(saved)
+                saved[consign] = list(states[consign])
+                for hour_idx, value in hours.items():
+                    saved[consign][hour_idx] = value
+
+        self._saved_consigns = saved
+
+
+    async def fetch_all_data(self, concurrent=True, deadline=None):
+        """Refresh commands, measures and setpoints.
+
+        Args:
+            concurrent: fan out the independent requests on the shared authenticated session,
+                bounded by max_concurrent_requests, instead of running them one after another
+            deadline: overall budget in seconds (or a HydrocaptDeadline), remaining work is cancelled past it
+        """
+        return await self.fetch_data(HYDROCAPT_FAMILIES, concurrent=concurrent, deadline=deadline)
+
+    async def fetch_data(self, families, concurrent=True, deadline=None):
+        """Refresh only some data families, the others keep their last read values.
+
+        Args:
+            families: among HYDROCAPT_FAMILIES, the measures also read the alarm thresholds when not cached
+            concurrent: see fetch_all_data
+            deadline: see fetch_all_data
+
+        Returns:
+            The packaged data of all the families
+        """
+        return await self._run_with_deadline(self._fetch_data(families, concurrent), deadline)
+
+    async def _login_if_needed(self):
+        await self._get_pool_internal_id()
+        await self._get_session().login_if_needed()
+
+    def _needs_login(self) -> bool:
+        return self.pool_internal_id < 0 or self._get_session().needs_login
+
+    def _get_family_readers(self, families):
+        readers = {
+            HYDROCAPT_FAMILY_COMMANDS: self.get_commands_current_states,
+            HYDROCAPT_FAMILY_MEASURES: self.get_pool_measure_latest,
+            HYDROCAPT_FAMILY_SETPOINTS: self.get_current_consigns,
+        }
+        return [readers[f] for f in HYDROCAPT_FAMILIES if f in families]
+
+    async def _fetch_data(self, families, concurrent):
+        #login (and pool discovery) once, or check a restored session, before fanning out on the session
+        #only when it sends a request: a check without one must not spend the half-open trial of the breaker
+        if self._needs_login():
+            await self._call_with_retry(self._login_if_needed)
+
+        readers = self._get_family_readers(families)
+
+        if concurrent is False:
+            for reader in readers:
+                await reader()
+            return self.get_packaged_data()
+
+        await self._gather(*[reader() for reader in readers])
+
+        return self.get_packaged_data()
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""Asyncio session manager for the hydrocapt API in order to maintain authentication between calls."""
+
+import asyncio
+
+import aiohttp
+from aiohttp import ClientSession
+
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from yarl import URL
+
+from .exceptions import HydrocaptAuthError, HydrocaptConnectionError, HydrocaptTimeoutError
+from .exceptions import check_http_status
+from .deadline import get_endpoint_timeout
+from .decoding import HydrocaptPoolSerialScanner, POOL_PAGE_CHUNK_SIZE, parse_status, is_not_authenticated
+
+from .const import HYDROCAPT_LOGIN_URL
+from .const import HYDROCAPT_DISCONNECT_URL
+from .const import HYDROCAPT_EDIT_POOL_OWN_URL
+from .const import HYDROCAPT_GET_POOL_COMMAND_URL
+
+
+class AsyncHydrocaptClientSession(object):
+    """Asyncio HTTP session manager for Hydrocapt api.
+    This session object allows to manage the authentication and re-authentication on top of an aiohttp session.
+    The authentication lives in the aiohttp cookie jar, so the aiohttp session must not be shared with other users.
+    """
+
+
+    def __init__(self, username: str, password: str, pool_internal_id :int = -1, websession: Optional[ClientSession] = None, request_semaphore: Optional[asyncio.Semaphore] = None, on_login: Optional[Callable[[Dict[str, Any]], None]] = None, timeouts: Optional[Dict[str, Any]] = None) -> None:
+        """Initialize, authentication is done lazily on first call.
+
+        Args:
+            username: the hydrocapt registered user
+            password: the hydrocapt user's password
+            pool_internal_id: the internal pool id if known, discovered at login otherwise
+            websession: the aiohttp session to use, one is created if not given
+            request_semaphore: bounds the number of requests in flight, shared between sessions of a client
+            on_login: called with the new auth state (see get_auth_state) after each successful login
+            timeouts: per endpoint (connect, read) timeouts overriding HYDROCAPT_DEFAULT_TIMEOUTS
+        """
+
+        self.username = username
+        self.password = password
+        self._websession = websession
+        #only a websession created here is closed by aclose
+        self._owns_websession = websession is None
+        self._session : Optional[ClientSession] = None
+        self._pool_internal_id = pool_internal_id
+        self._request_semaphore = request_semaphore
+        self._on_login = on_login
+        self._timeouts = timeouts
+        #True when the current cookies come from a restored auth state and were not checked yet
+        self._restored_unchecked = False
+        #single-flight login: concurrent callers wait for one login and share its result
+        self._login_lock = asyncio.Lock()
+        self._login_generation = 0
+
+    def _get_websession(self) -> ClientSession:
+        if self._websession is None:
+            self._websession = aiohttp.ClientSession()
+        return self._websession
+
+    def _get_timeout(self, url) -> aiohttp.ClientTimeout:
+        connect, read = get_endpoint_timeout(url, self._timeouts)
+        return aiohttp.ClientTimeout(total=None, connect=connect, sock_read=read)
+
+    async def aclose(self):
+        """Forget the authentication, and close the aiohttp session if it was created here."""
+        async with self._login_lock:
+            self._session = None
+            self._restored_unchecked = False
+            websession = self._websession
+            if self._owns_websession:
+                self._websession = None
+        if self._owns_websession and websession is not None and not websession.closed:
+            await websession.close()
+
+    async def _new_session(self) -> ClientSession:
+
+        websession = self._get_websession()
+
+        #forget any previous authentication before login again
+        websession.cookie_jar.clear()
+
+        payload = {
+            "login": self.username,
+            "pass": self.password,
+        }
+
+        await self._inner_request(
+            "POST",
+            HYDROCAPT_LOGIN_URL,
+            data=payload,
+            headers=dict(referer=HYDROCAPT_DISCONNECT_URL),
+            websession=websession,
+        )
+
+        if self._pool_internal_id < 0:
+
+            serials = await self._scan_pool_serials(True, websession)
+
+            if len(serials) == 0:
+                #the pool page has no serial when the login was refused
+                raise HydrocaptAuthError("Hydrocapt Diffazur: Can't get pool id")
+
+            self._pool_internal_id = serials[0]
+
+        self._restored_unchecked = False
+
+        if self._on_login is not None:
+            self._on_login(self.get_auth_state(websession))
+
+        return websession
+
+    async def _scan_pool_serials(self, first_only: bool = True, websession: Optional[ClientSession] = None) -> List[int]:
+        """Stream the pool page, stopping as soon as the scanner found what it looks for."""
+
+        if websession is None:
+            websession = self._session
+
+        url = HYDROCAPT_EDIT_POOL_OWN_URL
+        scanner = HydrocaptPoolSerialScanner(first_only)
+        try:
+            async with websession.request("GET", url, timeout=self._get_timeout(url)) as ret:
+                check_http_status(ret.status, url)
+                async for chunk in ret.content.iter_chunked(POOL_PAGE_CHUNK_SIZE):
+                    if scanner.feed(chunk):
+                        break
+        except asyncio.TimeoutError as exc:
+            raise HydrocaptTimeoutError(f"Hydrocapt request timed out: {url}") from exc
+        except aiohttp.ClientError as exc:
+            raise HydrocaptConnectionError(f"Hydrocapt request failed: {url}: {exc}") from exc
+
+        return scanner.close()
+
+    async def get_pool_serials(self) -> List[int]:
+        """Serials of all the pools of the account, read in one pass over the pool page."""
+
+        await self._login_if_no_session()
+
+        return await self._scan_pool_serials(False)
+
+    def get_auth_state(self, websession: Optional[ClientSession] = None) -> Dict[str, Any]:
+        """Return what is needed to reuse the current authentication later, without login again."""
+        if websession is None:
+            websession = self._session
+
+        cookies = {}
+        if websession is not None:
+            for morsel in websession.cookie_jar:
+                cookies[morsel.key] = morsel.value
+
+        return {"cookies": cookies, "pool_internal_id": self._pool_internal_id}
+
+    def restore_auth_state(self, auth_state: Dict[str, Any]):
+        """Reuse a previously saved authentication, it will be checked before the first real request."""
+        cookies = auth_state.get("cookies")
+        pool_internal_id = auth_state.get("pool_internal_id", -1)
+
+        if pool_internal_id is not None and pool_internal_id >= 0 and self._pool_internal_id < 0:
+            self._pool_internal_id = pool_internal_id
+
+        if not cookies or self._pool_internal_id < 0:
+            return
+
+        websession = self._get_websession()
+        websession.cookie_jar.clear()
+        websession.cookie_jar.update_cookies(cookies, response_url=URL(HYDROCAPT_LOGIN_URL).origin())
+
+        self._session = websession
+        self._restored_unchecked = True
+
+    async def _is_restored_session_valid(self):
+
+        try:
+            content = await self._inner_request("GET", f"{HYDROCAPT_GET_POOL_COMMAND_URL}?serial={self._pool_internal_id}")
+        except Exception:
+            return False
+
+        #judged from the status of the answer, the raw body only when it isn't xml
+        _, _, to_probe = parse_status(content)
+        if is_not_authenticated(to_probe):
+            return False
+
+        return True
+
+    @property
+    def login_generation(self) -> int:
+        """Incremented on each login, to be read before a request that may need a relogin."""
+        return self._login_generation
+
+    async def relogin(self, failed_generation: Optional[int] = None):
+        """Login again, once for all the callers that saw the same failure.
+
+        Args:
+            failed_generation: login_generation read before the failed request, if a login happened
+                since then the session is already fresh and nothing is done
+        """
+        async with self._login_lock:
+            if failed_generation is not None and failed_generation != self._login_generation:
+                return
+            self._session = await self._new_session()
+            self._login_generation += 1
+
+    async def _login_if_no_session(self):
+        if self._session is None:
+            await self.relogin(self._login_generation)
+
+    async def get_internal_pool_id(self):
+
+        if self._pool_internal_id < 0 or self._session is None:
+            await self.relogin(self._login_generation)
+
+        return self._pool_internal_id
+
+    async def is_connection_ok(self):
+        p_id = await self.get_internal_pool_id()
+
+        if p_id >= 0 and self._session is not None:
+            return True
+
+        return False
+
+    @property
+    def needs_login(self) -> bool:
+        """True when login_if_needed would send a request: no session yet, or a restored one not checked."""
+        return self._session is None or self._restored_unchecked
+
+    async def login_if_needed(self):
+        """Authenticate once before several requests are fanned out on this session.
+
+        A restored authentication is checked with one cheap request, login is done only if it is stale.
+        """
+        if self._session is not None and self._restored_unchecked is False:
+            return
+
+        login_generation = self._login_generation
+        async with self._login_lock:
+            if login_generation != self._login_generation:
+                return
+
+            if self._session is not None and self._restored_unchecked is True:
+                self._restored_unchecked = False
+                if await self._is_restored_session_valid() is True:
+                    return
+
+            self._session = await self._new_session()
+            self._login_generation += 1
+
+    async def _request(self, method, url, data=None, headers=None):
+
+        if self._request_semaphore is None:
+            return await self._inner_request(method, url, data=data, headers=headers)
+
+        async with self._request_semaphore:
+            return await self._inner_request(method, url, data=data, headers=headers)
+
+    async def _inner_request(self, method, url, data=None, headers=None, websession: Optional[ClientSession] = None):
+
+        if websession is None:
+            websession = self._session
+
+        try:
+            async with websession.request(method, url, data=data, headers=headers, timeout=self._get_timeout(url)) as ret:
+                check_http_status(ret.status, url)
+                #the raw body: the xml and json parsers read bytes, no charset guessing and decoding
+                return await ret.read()
+        except asyncio.TimeoutError as exc:
+            raise HydrocaptTimeoutError(f"Hydrocapt request timed out: {url}") from exc
+        except aiohttp.ClientError as exc:
+            raise HydrocaptConnectionError(f"Hydrocapt request failed: {url}: {exc}") from exc
+
+    async def post(self, url, data, headers=None):
+        """Single POST, errors are raised as HydrocaptError subclasses, retries are up to the caller."""
+
+        await self._login_if_no_session()
+
+
+        if headers is None:
+            headers = {}
+
+        if headers.get("referer") is None:
+            headers["referer"] = url
+
+        return await self._request("POST", url, data=data, headers=headers)
+
+    async def get(self, url):
+        """Single GET, errors are raised as HydrocaptError subclasses, retries are up to the caller."""
+
+        await self._login_if_no_session()
+
+        return await self._request("GET", url)
@@ -1,18 +1,15 @@
 # -*- coding: utf-8 -*-
 """Client for the Diffazur Hydrocapt API."""
-import copy
+import json
 import time
 from typing import Any
 from typing import Dict
+from typing import List
 from typing import Optional
-
-
-from lxml import etree
-from dateutil.parser import parse
+from typing import Tuple
 
 
 from datetime import datetime
-from datetime import timedelta
 
 #if issues with .maymodule relative imports
 if __package__ is None or len(__package__) <= 1:
@@ -25,6 +22,14 @@ if __package__ is None or len(__package__) <= 1:
 
 from .session import HydrocaptClientSession
 from .exceptions import HydrocaptError
+from .exceptions import HydrocaptAuthError
+from .exceptions import HydrocaptServerError
+from .exceptions import HydrocaptProtocolError
+from .deadline import HydrocaptDeadline
+from .history import HydrocaptHistoryArrays, parse_history_arrays
+from .decoding import DATAS, get_datas_fields, contains_text, parse_status, is_not_authenticated
+from .retry import HydrocaptCircuitBreaker
+from .retry import HYDROCAPT_READ_RETRY_POLICIES, HYDROCAPT_WRITE_RETRY_POLICIES, get_retry_policy
 
 from .const import HYDROCAPT_AJAX_VALUES_HISTORY
 from .const import HYDROCAPT_GET_POOL_COMMAND_URL
@@ -40,6 +45,9 @@ from .const import HYDROCAPT_AJAX_POOL_HISTORIC
 from .const import HYDROCAPT_GET_ALARMS_URL
 
 from .const import HYDROCAPT_GET_POOL_CONSIGN_URL
+from .const import HYDROCAPT_DEFAULT_ALARMS_CACHE_TTL_S
+from .const import HYDROCAPT_HISTORY_MEASURES, HYDROCAPT_HISTORY_TYPE_DATES
+from .const import HYDROCAPT_FAMILY_COMMANDS, HYDROCAPT_FAMILY_MEASURES, HYDROCAPT_FAMILY_SETPOINTS, HYDROCAPT_FAMILIES
 from .const import HYDROCAPT_SAVE_POOL_CONSIGN_URL
 
 from .const import HYDROCAPT_HEATING_REGULATION_COMMAND, HYDROCAPT_HEATING_REGULATION_WATER_TEMPERATURE, HYDROCAPT_HEATING_REGULATION_TEMPARATURE_CONSIGN
@@ -50,19 +58,28 @@ NUM_CHECK_COMMANDS = 10
 WAIT_BETWEEN_CHACK_S = 3
 
 
-class HydrocaptClient(object):
-    """Proxy to the Hydrocapt REST API."""
+class HydrocaptClientBase(object):
+    """Transport independent part of the Hydrocapt API proxies.
 
-    def __init__(self, username: str, password: str, pool_id: Optional[int] = -1, pool_internal_id: Optional[int] = -1) -> None:
-        """Initialize the API and authenticate so we can make requests.
+    Holds the pool identity, the last read values and all the parsing / translation logic
+    shared by the synchronous and the asyncio clients.
+    """
+
+    def __init__(self, username: str, password: str, pool_id: Optional[int] = -1, pool_internal_id: Optional[int] = -1, circuit_breaker: Optional[HydrocaptCircuitBreaker] = None, alarms_cache_ttl_s: float = HYDROCAPT_DEFAULT_ALARMS_CACHE_TTL_S) -> None:
+        """Initialize the API.
 
         Args:
             username: string containing your Hydrocapt's app username
             password: string containing your Hydrocapt's app password
+            circuit_breaker: shared breaker stopping calls during a cloud outage, one is created if not given
+            alarms_cache_ttl_s: how long the alarm thresholds are reused before being read again, 0 to never cache them
         """
         self.username = username
         self.password = password
-        self.session: Optional[HydrocaptClientSession] = None
+
+        if circuit_breaker is None:
+            circuit_breaker = HydrocaptCircuitBreaker()
+        self.circuit_breaker = circuit_breaker
 
         if pool_internal_id < 0:
             if pool_id >= 10000:
@@ -72,187 +89,138 @@ class HydrocaptClient(object):
         self._saved_states = {}
         self._saved_consigns = {}
         self._saved_read_values = {}
+        self._saved_series = {}
 
-    def _get_session(self, force_reconnect=False) -> HydrocaptClientSession:
-        if self.session is None or force_reconnect is True:
-            self.session = HydrocaptClientSession(self.username, self.password, self.pool_internal_id)
-
-        return self.session
-
-    def _get_pool_internal_id(self):
-        if self.pool_internal_id < 0:
-            session = self._get_session()
-            self.pool_internal_id = session.get_internal_pool_id()
-        return self.pool_internal_id
-
-    def get_pool_id(self):
-        return self._get_pool_internal_id()
-
-    def is_connection_ok(self):
-        session = self._get_session()
-        if session is None:
-            return False
-
-        if session.is_connection_ok() is False:
-            return False
-
-        pool_id = self._get_pool_internal_id()
-        if  pool_id < 0:
-            return False
-
-        return True
+        self.alarms_cache_ttl_s = alarms_cache_ttl_s
+        self._alarms_cache = None
+        self._alarms_cache_time = 0.0
 
 
-    def _inner_check_response(self, cmd_result):
+    def _inner_check_response(self, content):
+        """Parse an answer body with parse_status, an expired session raises HydrocaptAuthError."""
 
-        cmd_result.raise_for_status()
-        rTree = None
-        r = None
+        r, rTree, to_probe = parse_status(content)
 
-        to_probe = cmd_result.text
-        try:
-            rTree = etree.fromstring(cmd_result.text)
-            r = rTree.xpath("/root/status")
-            if r is not None and len(r) > 0:
-                to_probe = r[0].text
-            else:
-                r = None
-        except Exception:
-            to_probe = cmd_result.text
-            rTree = None
-            r  =None
-
-        if "You are not authenticated" in to_probe:
-            raise HydrocaptError
+        if is_not_authenticated(to_probe):
+            raise HydrocaptAuthError("Hydrocapt session not authenticated")
 
         return r, rTree, to_probe
 
 
 
 
-    def _check_command_consign_result_save(self, result_save):
+    def _check_command_consign_result_save(self, content):
 
-        _, _, to_probe = self._inner_check_response(result_save)
+        _, _, to_probe = self._inner_check_response(content)
 
-        if "Pas de modification" in to_probe:
+        if contains_text(to_probe, "Pas de modification"):
             #ok no modification
             return None
 
         return True
 
-    def _check_xml_not_authenticated(self, cmd_result):
+    def _check_xml_not_authenticated(self, content):
 
-        r, rTree, to_probe = self._inner_check_response(cmd_result)
+        r, rTree, to_probe = self._inner_check_response(content)
 
         if r is not None:
             if "OK" in to_probe:
                 return rTree
 
-            raise HydrocaptError
+            raise HydrocaptServerError(f"Hydrocapt status: {to_probe}")
 
         return rTree
 
+    def _decode_json(self, content):
+        try:
+            #json.loads detects the utf encoding of bytes itself
+            return json.loads(content)
+        except ValueError as exc:
+            raise HydrocaptProtocolError("Hydrocapt answer is not valid json") from exc
 
-    def _get_pool_measure_latest(self) -> Dict[str, Any]:
-        """Retrieve most recents measures.
 
+    def _get_pool_history_url(self, pool_id, today, type_date="day"):
+        if type_date not in HYDROCAPT_HISTORY_TYPE_DATES:
+            raise ValueError(f"Unknown history type_date {type_date}, expected one of {HYDROCAPT_HISTORY_TYPE_DATES}")
+        return f"{HYDROCAPT_AJAX_VALUES_HISTORY}?serial={pool_id}&date={today}&type_date={type_date}"
 
-        Raises:
-            HydrocaptError: when hydrocapt API returns an incorrect response
+    def _check_pool_history(self, history, allow_empty=False):
+        """An error or empty answer is what the history endpoint returns once the session expired.
 
-        Returns:
-            A dict whose keys are :
-                water_temperature: A float representing the temperature of the pool.
-                technical_room_temperature: A float representing the temperature of the pool technical room.
-                ph: A float representing the ph of the pool.
-                conductivity: A float representing the conductivity of the pool.
-                redox: A float representing the oxydo reduction level of the pool.
-                date_time: The date time when the measure was taken.
-                ph_status : Alert status for PH value in : TooLow, OK, TooHigh
-                conductivity_status : Alert status for conductivity value in : TooLow, OK, TooHigh
-                redox_status : Alert status for redox in : TooLow, OK, TooHigh
+        Args:
+            allow_empty: a past period may have no record at all (before the pool existed): not an auth error then
         """
-        pool_id = self._get_pool_internal_id()
-        if pool_id < 0:
-            raise HydrocaptError("can't get pool id in measure")
-
-        today = datetime.today().strftime('%Y-%m-%d')
-        get_pool_data_url = f"{HYDROCAPT_AJAX_VALUES_HISTORY}?serial={pool_id}&date={today}&type_date=day"
+        if history.get("error") is not None or history.get("errors") is not None:
+            raise HydrocaptAuthError("Hydrocapt history answer is in error")
+        if len(history.get("records", [])) == 0 and allow_empty is False:
+            raise HydrocaptAuthError("Hydrocapt history answer is empty")
+        return history
 
-        pool_data = self._get_session().get(get_pool_data_url)
-        a = pool_data.json()
-        records = a.get("records", [])
+    def _is_pool_history_empty(self, history):
+        return len(history.get("records", [])) == 0
 
+    def _parse_pool_history(self, history, today, arrays: Optional[HydrocaptHistoryArrays] = None) -> Dict[str, Any]:
+        """Extract the most recent measures from a getJsonValues answer.
 
-        if a.get("error") is not None or a.get("errors") is not None or len(records) == 0:
-            pool_data = self._get_session(force_reconnect=True).get(get_pool_data_url)
-            a = pool_data.json()
+        Args:
+            arrays: the answer already parsed by parse_history_arrays, to not parse it again
+        """
 
         #a = json.loads(pool_data.content)
-        records = a.get("records", [])
+        records = history.get("records", [])
 
 
         if len(records) == 0:
-            raise HydrocaptError("No data records from pool")
+            raise HydrocaptProtocolError("No data records from pool")
 
-        vals = {"WATER_TEMP":"water_temperature", "AIR_TEMP":"technical_room_temperature", "PH":"ph", "CONDUCTIVITY":"conductivity", "ORP":"redox"} #redox is ORP
-
-        bad_vals = {"--.-", "--", "-.-", "---" }
+        if arrays is None:
+            arrays = parse_history_arrays(history, today)
 
         cur_data = {}
 
-        num_hours = 0 #in the records tab : the list of measure fpr pH, watertemps, etc are per hour ... so th elast one from midnoight to it is the time the measure has been performed
-
-        dates = [today]*25
-
-        for r in records:
-
-            cur_c = r.get("typeInfo", "NOT A VALUE")
-            if cur_c in vals:
-                r_vals = r.get("values", ["--"]*25)
-                do_count_hours = False
-                if cur_c == "PH":
-                    do_count_hours = True
-
-                cd = -1
-                for i in range(len(r_vals)-1, -1 , -1):
-                    if r_vals[i] in bad_vals:
-                        continue
+        for out_data in HYDROCAPT_HISTORY_MEASURES.values():
+            if out_data not in arrays.columns:
+                cur_data[out_data] = None
+                continue
+            idx = arrays.latest_valid_index(out_data)
+            #a measure with no value at all in the day reads -1
+            cur_data[out_data] = -1.0 if idx is None else float(arrays.columns[out_data][idx])
 
-                    if do_count_hours:
-                        num_hours = i
+        #in the records tab : the list of measure fpr pH, watertemps, etc are per hour ... so th elast one from midnoight to it is the time the measure has been performed
+        num_hours = arrays.latest_valid_index("ph") or 0
 
-                    cd = r_vals[i]
-                    break
+        #ok num_hours is the index of the measure in the hour based values array
+        cur_data["date_time"] = arrays.get_datetime(num_hours)
 
-                cur_data[vals[cur_c]] = float(cd)
-            elif cur_c == "DATE":
-                dates = r.get("values", [today]*25)
+        return cur_data
 
+    def _parse_pool_history_series(self, history, today, arrays: Optional[HydrocaptHistoryArrays] = None) -> Dict[str, List[Tuple[datetime, float]]]:
+        """Extract all the hourly measures of a getJsonValues answer, not only the most recent ones.
 
-        for k, out_data in vals.items():
-            if cur_data.get(out_data, None) is None:
-                cur_data[out_data] = None
+        Args:
+            arrays: the answer already parsed by parse_history_arrays, to not parse it again
 
-        #ok num_hours is the index of the measure in the hour based values array
-        measure_date = dates[num_hours]
-        measure_date = parse(measure_date) + timedelta(hours=num_hours)
-        cur_data["date_time"] = measure_date
+        Returns:
+            For each measure name, the (date time, value) of every hour having a valid value, oldest first
+        """
+        if arrays is None:
+            arrays = parse_history_arrays(history, today)
 
-        #now time to get the limits!
+        return {name: arrays.get_series(name) for name in arrays.columns}
 
-        get_alarms_data = {"serial":pool_id}
+    def get_hourly_series(self) -> Dict[str, List[Tuple[datetime, float]]]:
+        """All the hourly measures of the day returned by the last measures refresh, see _parse_pool_history_series."""
+        return self._saved_series
 
-        result_get_alarms = self._get_session().post(
-            HYDROCAPT_GET_ALARMS_URL,
-            data=get_alarms_data,
-            headers=dict(referer=f"{HYDROCAPT_AJAX_POOL_HISTORIC}?serial={pool_id}")
-        )
+    def _get_history_date(self, date) -> str:
+        if isinstance(date, str):
+            return date
+        return date.strftime('%Y-%m-%d')
 
-        tree_alarms = self._check_xml_not_authenticated(result_get_alarms)
+    def _parse_alarms(self, tree_alarms):
 
         if tree_alarms is None:
-            raise HydrocaptError
+            raise HydrocaptProtocolError("Hydrocapt alarms answer is not xml")
 
 
         alarms = {}
@@ -279,6 +247,27 @@ class HydrocaptClient(object):
                 if name is not None:
                     alarms[name] = alarm
 
+        return alarms
+
+    def _get_cached_alarms(self):
+        """Return the alarm thresholds read less than alarms_cache_ttl_s ago, None if they must be read."""
+        if self._alarms_cache is None:
+            return None
+
+        if time.monotonic() - self._alarms_cache_time >= self.alarms_cache_ttl_s:
+            return None
+
+        return self._alarms_cache
+
+    def _cache_alarms(self, alarms):
+        self._alarms_cache = alarms
+        self._alarms_cache_time = time.monotonic()
+
+    def invalidate_alarms_cache(self):
+        """Forget the alarm thresholds, to be called when they were changed: the next measure refresh reads them."""
+        self._alarms_cache = None
+
+    def _apply_alarms(self, cur_data, alarms):
 
         #now check the alarms:
 
@@ -296,27 +285,6 @@ class HydrocaptClient(object):
         return cur_data
 
 
-    def get_pool_measure_latest(self) -> Dict[str, Any]:
-
-        try:
-            read_data = self._get_pool_measure_latest()
-        except Exception:
-            read_data = {}
-
-        if read_data is None or len(read_data) == 0:
-            self._get_session(force_reconnect=True)
-            read_data = self._get_pool_measure_latest()
-
-        if read_data is None or len(read_data) == 0:
-            raise HydrocaptError("Cannot get pool measures")
-
-        self._saved_read_values = read_data
-
-        return read_data
-
-
-
-
     def _get_hydrocapt_internal_command_states_from_external(self, external_commands):
 
         internal_commands = {}
@@ -343,116 +311,25 @@ class HydrocaptClient(object):
         return external_commands
 
 
-
-    def _get_commands_current_states(self) -> Dict[str, Any]:
-
-        pool_id = self._get_pool_internal_id()
-
-        get_pool_command_url = f"{HYDROCAPT_GET_POOL_COMMAND_URL}?serial={pool_id}"
-
-        commands_state = self._get_session().get(get_pool_command_url)
-
-        tree_cmd_state = self._check_xml_not_authenticated(commands_state)
+    def _parse_commands_states(self, tree_cmd_state) -> Dict[str, Any]:
 
         if tree_cmd_state is None:
-            raise HydrocaptError
+            raise HydrocaptProtocolError("Hydrocapt commands answer is not xml")
 
         internal_states = {}
 
+        fields = get_datas_fields(tree_cmd_state)[DATAS]
+
         for state in HYDROCAPT_INTERNAL_TO_EXTERNAL_COMMANDS:
             try:
-                r = tree_cmd_state.xpath(f"/root/datas/{state}")
-                state_val = int(r[0].text)
-                internal_states[state] = state_val
+                internal_states[state] = int(fields[state])
             except Exception:
                 pass
 
-        return self._get_hydrocapt_external_command_states_from_internal(internal_states)
-
-    def get_commands_current_states(self) -> Dict[str, Any]:
-
-        try:
-            states = self._get_commands_current_states()
-        except Exception:
-            states = {}
-
-        if len(states) == 0:
-            self._get_session(force_reconnect=True)
-            states = self._get_commands_current_states()
-
-        if len(states) == 0:
-            raise HydrocaptError("Cannot get commands state")
-
-        self._saved_states = states
-
-        return states
-
-
-
-
-    def _set_command_state(self, command, state):
-
-        pool_id = self._get_pool_internal_id()
-        if pool_id is None or pool_id < 0:
-            raise HydrocaptError("Can't get pool id")
-
-        external_commands = {command:state}
-        save_internal_commands = self._get_hydrocapt_internal_command_states_from_external(external_commands)
-        save_internal_commands["serial"] = pool_id
-        #save_internal_commands["type_aux1"] = 0
-
-        result_save = self._get_session().post(
-            HYDROCAPT_SAVE_POOL_COMMAND_URL,
-            data=save_internal_commands,
-            headers=dict(referer=HYDROCAPT_POOL_LIST_OWN_URL)
-        )
-
-        rs = self._check_command_consign_result_save(result_save)
-
-        if rs is None:
-            return None
-
-
-        # wait for change to happen
-        for i in range(NUM_CHECK_COMMANDS):
-            cur_states = self.get_commands_current_states()
-            if cur_states.get(command) == state:
-                return cur_states
-            time.sleep(WAIT_BETWEEN_CHACK_S)
-
-        raise HydrocaptError
-
-
-    def set_command_state(self, command, state, get_prev=False):
-
-        prev_state = None
-
-        if get_prev is True:
-            curr_states = self.get_commands_current_states()
-            prev_state = curr_states.get(command)
-
-        try:
-            saved_states = self._set_command_state(command, state)
-            if saved_states is None:
-                #No change
-                return prev_state
-        except Exception:
-            saved_states = {}
-
-        if len(saved_states) == 0:
-            self._get_session(force_reconnect=True)
-            saved_states = self._set_command_state(command, state)
-            if saved_states is None:
-                #No change
-                return prev_state
-
-        if len(saved_states) == 0:
-            raise HydrocaptError("Cannot save command state")
-
-        self._saved_states = saved_states
-
-        return prev_state
+        if len(internal_states) == 0:
+            raise HydrocaptProtocolError("Cannot get commands state")
 
+        return self._get_hydrocapt_external_command_states_from_internal(internal_states)
 
 
     def get_commands_and_options(self):
@@ -529,12 +406,375 @@ class HydrocaptClient(object):
         return external_consigns
 
 
+    def _parse_consigns(self, tree_consign_state) -> Dict[str, Any]:
+
+        if tree_consign_state is None:
+            raise HydrocaptProtocolError("Hydrocapt setpoints answer is not xml")
+
+        internal_consigns = {}
+
+        fields = get_datas_fields(tree_consign_state)
+
+        for state in HYDROCAPT_INTERNAL_TO_EXTERNAL_CONSIGNS:
+            for parent in ["select", "timer"]:
+                if state in fields[parent]:
+                    internal_consigns[state] = fields[parent][state]
+
+        if len(internal_consigns) == 0:
+            raise HydrocaptProtocolError("Cannot get current consigns")
+
+        return self._get_hydrocapt_external_consign_from_internal(internal_consigns)
+
+    def _is_timer_hour_edit_valid(self, consign, hour_idx):
+
+        if HYDROCAPT_EXTERNAL_TO_INTERNAL_CONSIGNS.get(consign,[consign, "integer"])[1] != HYDROCAPT_TIMER:
+            return False
+
+        if hour_idx < 0 or hour_idx >= 24:
+            return False
+
+        return True
+
+    def _get_edited_timer(self, consign, hour_idx, value):
+        return self._get_edited_timer_hours(consign, {hour_idx: value})
+
+    def _get_edited_timer_hours(self, consign, hours):
+
+        cur_timer = self._saved_consigns.get(consign)
+
+        if cur_timer is None:
+            return None
+
+        #work on a copy: the saved list may be shared with already published data
+        cur_timer = list(cur_timer)
+        for hour_idx, value in hours.items():
+            cur_timer[hour_idx] = value
+
+        return cur_timer
+
+
+    def get_family_keys(self, family):
+        """Keys of the packaged data coming from one of HYDROCAPT_FAMILIES, as last read."""
+        saved = {
+            HYDROCAPT_FAMILY_COMMANDS: self._saved_states,
+            HYDROCAPT_FAMILY_MEASURES: self._saved_read_values,
+            HYDROCAPT_FAMILY_SETPOINTS: self._saved_consigns,
+        }
+        return list(saved[family])
+
+    def get_packaged_data(self):
+
+        res = {}
+
+        for k,v in self._saved_states.items():
+            res[k] = v
+
+        for k,v in self._saved_read_values.items():
+            res[k] = v
+
+        for k,v in self._saved_consigns.items():
+            res[k] = v
+
+        return res
+
+
+class HydrocaptClient(HydrocaptClientBase):
+    """Proxy to the Hydrocapt REST API.
 
-    def _set_consign(self, consign, value):
+    Every public call accepts a deadline (seconds or a HydrocaptDeadline) bounding all its requests and waits.
+    """
+
+    def __init__(self, username: str, password: str, pool_id: Optional[int] = -1, pool_internal_id: Optional[int] = -1, timeouts: Optional[Dict[str, Any]] = None, circuit_breaker: Optional[HydrocaptCircuitBreaker] = None, alarms_cache_ttl_s: float = HYDROCAPT_DEFAULT_ALARMS_CACHE_TTL_S) -> None:
+        """Initialize the API and authenticate so we can make requests.
+
+        Args:
+            username: string containing your Hydrocapt's app username
+            password: string containing your Hydrocapt's app password
+            timeouts: per endpoint (connect, read) timeouts overriding HYDROCAPT_DEFAULT_TIMEOUTS
+            circuit_breaker: shared breaker stopping calls during a cloud outage, one is created if not given
+            alarms_cache_ttl_s: how long the alarm thresholds are reused before being read again, 0 to never cache them
+        """
+        super().__init__(username, password, pool_id=pool_id, pool_internal_id=pool_internal_id, circuit_breaker=circuit_breaker, alarms_cache_ttl_s=alarms_cache_ttl_s)
+        self._timeouts = timeouts
+        self.session: Optional[HydrocaptClientSession] = None
+
+    def _get_session(self) -> HydrocaptClientSession:
+        #one session for the client lifetime: it serializes the re-authentications
+        if self.session is None:
+            self.session = HydrocaptClientSession(self.username, self.password, self.pool_internal_id, timeouts=self._timeouts)
+
+        return self.session
+
+    def close(self):
+        """Release the connections, the client can still be used after, it will login again."""
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _get_pool_internal_id(self):
+        if self.pool_internal_id < 0:
+            session = self._get_session()
+            self.pool_internal_id = session.get_internal_pool_id()
+        return self.pool_internal_id
+
+    def get_pool_id(self):
+        return self._get_pool_internal_id()
+
+    def get_pool_serials(self, deadline=None) -> List[int]:
+        """Internal ids of all the pools of the account."""
+        deadline = HydrocaptDeadline.of(deadline)
+        return self._call_with_retry(self._get_session().get_pool_serials, deadline=deadline)
+
+    def is_connection_ok(self):
+        session = self._get_session()
+        if session is None:
+            return False
+
+        if session.is_connection_ok() is False:
+            return False
+
+        pool_id = self._get_pool_internal_id()
+        if  pool_id < 0:
+            return False
+
+        return True
+
+    def _call_with_retry(self, func, *args, deadline: HydrocaptDeadline, policies=HYDROCAPT_READ_RETRY_POLICIES):
+        """Call func(*args, deadline), retrying according to the policy of the error class raised.
+
+        Network and server failures feed the circuit breaker, which fails fast while the cloud is down.
+        """
+        attempt = 0
+        relogin_from = None
+        while True:
+            trial = self.circuit_breaker.before_call()
+            try:
+                session = self._get_session()
+                login_generation = session.login_generation
+                try:
+                    if relogin_from is not None:
+                        session.relogin(relogin_from, deadline)
+                        relogin_from = None
+                        login_generation = session.login_generation
+                    ret = func(*args, deadline)
+                except HydrocaptError as exc:
+                    self.circuit_breaker.record_failure(exc)
+                    attempt += 1
+                    policy = get_retry_policy(exc, policies)
+                    if attempt >= policy.max_attempts:
+                        raise
+                    if policy.relogin:
+                        relogin_from = login_generation
+                    deadline.sleep(policy.get_delay(attempt))
+                    continue
+
+                self.circuit_breaker.record_success()
+                return ret
+            finally:
+                #a trial ended by anything but a recorded outcome must not keep the circuit open
+                self.circuit_breaker.release_trial(trial)
+
+
+    def _get_pool_measure_latest(self, deadline: Optional[HydrocaptDeadline] = None) -> Dict[str, Any]:
+        """Retrieve most recents measures.
+
+
+        Raises:
+            HydrocaptError: when hydrocapt API returns an incorrect response
+
+        Returns:
+            A dict whose keys are :
+                water_temperature: A float representing the temperature of the pool.
+                technical_room_temperature: A float representing the temperature of the pool technical room.
+                ph: A float representing the ph of the pool.
+                conductivity: A float representing the conductivity of the pool.
+                redox: A float representing the oxydo reduction level of the pool.
+                date_time: The date time when the measure was taken.
+                ph_status : Alert status for PH value in : TooLow, OK, TooHigh
+                conductivity_status : Alert status for conductivity value in : TooLow, OK, TooHigh
+                redox_status : Alert status for redox in : TooLow, OK, TooHigh
+        """
+        pool_id = self._get_pool_internal_id()
+        if pool_id < 0:
+            raise HydrocaptProtocolError("can't get pool id in measure")
+
+        today = datetime.today().strftime('%Y-%m-%d')
+        get_pool_data_url = self._get_pool_history_url(pool_id, today)
+
+        pool_data = self._get_session().get(get_pool_data_url, deadline=deadline)
+        a = self._check_pool_history(self._decode_json(pool_data.content))
+
+        arrays = parse_history_arrays(a, today)
+        cur_data = self._parse_pool_history(a, today, arrays)
+        self._saved_series = self._parse_pool_history_series(a, today, arrays)
+
+        #now time to get the limits! they rarely change, read them only when the cache expired
+
+        alarms = self._get_cached_alarms()
+
+        if alarms is None:
+            get_alarms_data = {"serial":pool_id}
+
+            result_get_alarms = self._get_session().post(
+                HYDROCAPT_GET_ALARMS_URL,
+                data=get_alarms_data,
+                headers=dict(referer=f"{HYDROCAPT_AJAX_POOL_HISTORIC}?serial={pool_id}"),
+                deadline=deadline,
+            )
+
+            tree_alarms = self._check_xml_not_authenticated(result_get_alarms.content)
+
+            alarms = self._parse_alarms(tree_alarms)
+            self._cache_alarms(alarms)
+
+        return self._apply_alarms(cur_data, alarms)
+
+
+    def _get_pool_history_series(self, date, type_date, deadline: Optional[HydrocaptDeadline] = None):
+
+        pool_id = self._get_pool_internal_id()
+        if pool_id < 0:
+            raise HydrocaptProtocolError("can't get pool id in history")
+
+        date = self._get_history_date(date)
+        pool_data = self._get_session().get(self._get_pool_history_url(pool_id, date, type_date), deadline=deadline)
+        a = self._check_pool_history(self._decode_json(pool_data.content), allow_empty=True)
+        if self._is_pool_history_empty(a):
+            return {}
+
+        return self._parse_pool_history_series(a, date)
+
+    def get_pool_history_series(self, date, type_date="day", deadline=None) -> Dict[str, List[Tuple[datetime, float]]]:
+        """Read a past period of measures, for a backfill.
+
+        Args:
+            date: a date (or a 'YYYY-MM-DD' string) in the period to read
+            type_date: one of HYDROCAPT_HISTORY_TYPE_DATES, the length of the period
+            deadline: seconds or HydrocaptDeadline bounding the whole read, retries included
+
+        Returns:
+            For each measure name, the (date time, value) of every valid point, see _parse_pool_history_series,
+            empty for a period without any record
+        """
+        deadline = HydrocaptDeadline.of(deadline)
+
+        return self._call_with_retry(self._get_pool_history_series, date, type_date, deadline=deadline)
+
+    def get_pool_measure_latest(self, deadline=None) -> Dict[str, Any]:
+
+        deadline = HydrocaptDeadline.of(deadline)
+
+        read_data = self._call_with_retry(self._get_pool_measure_latest, deadline=deadline)
+
+        self._saved_read_values = read_data
+
+        return read_data
+
+
+
+    def _get_commands_current_states(self, deadline: Optional[HydrocaptDeadline] = None) -> Dict[str, Any]:
+
+        pool_id = self._get_pool_internal_id()
+
+        get_pool_command_url = f"{HYDROCAPT_GET_POOL_COMMAND_URL}?serial={pool_id}"
+
+        commands_state = self._get_session().get(get_pool_command_url, deadline=deadline)
+
+        tree_cmd_state = self._check_xml_not_authenticated(commands_state.content)
+
+        return self._parse_commands_states(tree_cmd_state)
+
+    def get_commands_current_states(self, deadline=None) -> Dict[str, Any]:
+
+        deadline = HydrocaptDeadline.of(deadline)
+
+        states = self._call_with_retry(self._get_commands_current_states, deadline=deadline)
+
+        self._saved_states = states
+
+        return states
+
+
+
+
+    def _set_command_states(self, commands, deadline: Optional[HydrocaptDeadline] = None):
 
         pool_id = self._get_pool_internal_id()
         if pool_id is None or pool_id < 0:
-            raise HydrocaptError("Can't get pool id")
+            raise HydrocaptProtocolError("Can't get pool id")
+
+        save_internal_commands = self._get_hydrocapt_internal_command_states_from_external(commands)
+        save_internal_commands["serial"] = pool_id
+        #save_internal_commands["type_aux1"] = 0
+
+        result_save = self._get_session().post(
+            HYDROCAPT_SAVE_POOL_COMMAND_URL,
+            data=save_internal_commands,
+            headers=dict(referer=HYDROCAPT_POOL_LIST_OWN_URL),
+            deadline=deadline,
+        )
+
+        return self._check_command_consign_result_save(result_save.content)
+
+    def _confirm_command_states(self, commands, deadline: HydrocaptDeadline):
+
+        # wait for change to happen, one read checks all the commands of the batch
+        for i in range(NUM_CHECK_COMMANDS):
+            cur_states = self.get_commands_current_states(deadline=deadline)
+            if all(cur_states.get(command) == state for command, state in commands.items()):
+                return cur_states
+            deadline.sleep(WAIT_BETWEEN_CHACK_S)
+
+        raise HydrocaptServerError("Cannot save command state")
+
+
+    def set_command_state(self, command, state, get_prev=False, deadline=None):
+
+        prev_states = self.set_command_states({command: state}, get_prev=get_prev, deadline=deadline)
+
+        return prev_states.get(command)
+
+    def set_command_states(self, commands: Dict[str, str], get_prev=False, deadline=None) -> Dict[str, Any]:
+        """Write several command states in a single save request, confirmed by a single read.
+
+        Args:
+            commands: new state by command name, see get_commands_and_options
+            get_prev: read the current states first, they are returned
+
+        Returns:
+            The previous state of each command if get_prev, an empty dict otherwise
+        """
+        deadline = HydrocaptDeadline.of(deadline)
+
+        prev_states = {}
+
+        if get_prev is True:
+            curr_states = self.get_commands_current_states(deadline=deadline)
+            prev_states = {command: curr_states.get(command) for command in commands}
+
+        accepted = self._call_with_retry(self._set_command_states, commands, deadline=deadline, policies=HYDROCAPT_WRITE_RETRY_POLICIES)
+        if accepted is None:
+            #No change
+            return prev_states
+
+        #confirmed outside the write retry: a failed confirmation read must not send the save again
+        self._confirm_command_states(commands, deadline)
+
+        return prev_states
+
+
+
+    def _set_consign(self, consign, value, deadline: Optional[HydrocaptDeadline] = None):
+
+        pool_id = self._get_pool_internal_id()
+        if pool_id is None or pool_id < 0:
+            raise HydrocaptProtocolError("Can't get pool id")
 
         external_consigns = {consign:value}
         save_internal_consigns = self._get_hydrocapt_internal_consigns_from_external(external_consigns)
@@ -544,146 +784,100 @@ class HydrocaptClient(object):
         result_save = self._get_session().post(
             HYDROCAPT_SAVE_POOL_CONSIGN_URL,
             data=save_internal_consigns,
-            headers=dict(referer=HYDROCAPT_POOL_LIST_OWN_URL)
+            headers=dict(referer=HYDROCAPT_POOL_LIST_OWN_URL),
+            deadline=deadline,
         )
 
-        rs = self._check_command_consign_result_save(result_save)
+        return self._check_command_consign_result_save(result_save.content)
 
-        if rs is None:
-            return None
-
-        result_save.raise_for_status()
+    def _confirm_consign(self, consign, value, deadline: HydrocaptDeadline):
 
         # wait for change to happen
         for i in range(NUM_CHECK_COMMANDS):
-            cur_consigns = self.get_current_consigns()
+            cur_consigns = self.get_current_consigns(deadline=deadline)
             if cur_consigns.get(consign) == value:
                 return cur_consigns
-            time.sleep(WAIT_BETWEEN_CHACK_S)
+            deadline.sleep(WAIT_BETWEEN_CHACK_S)
+
+        raise HydrocaptServerError("Cannot save consign")
 
-        raise HydrocaptError
 
+    def set_consign(self, consign, value, get_prev=False, deadline=None):
 
-    def set_consign(self, consign, value, get_prev=False):
+        deadline = HydrocaptDeadline.of(deadline)
 
         prev_value = None
 
         if get_prev is True:
-            cur_consigns = self.get_current_consigns()
+            cur_consigns = self.get_current_consigns(deadline=deadline)
             prev_value = cur_consigns.get(consign)
 
-        try:
-            saved_states = self._set_consign(consign, value)
-            if saved_states is None:
-                #No change
-                return prev_value
-        except Exception:
-            saved_states = {}
-
-        if len(saved_states) == 0:
-            self._get_session(force_reconnect=True)
-            saved_states = self._set_consign(consign, value)
-            if saved_states is None:
-                #No change
-                return prev_value
-
+        accepted = self._call_with_retry(self._set_consign, consign, value, deadline=deadline, policies=HYDROCAPT_WRITE_RETRY_POLICIES)
+        if accepted is None:
+            #No change
+            return prev_value
 
-        if len(saved_states) == 0:
-            raise HydrocaptError("Cannot save consign")
-
-        self._saved_consigns = saved_states
+        #confirmed outside the write retry, see set_command_states
+        self._confirm_consign(consign, value, deadline)
 
         return prev_value
 
-    def set_consign_timer_hour(self, consign, hour_idx, value):
+    def set_consign_timer_hour(self, consign, hour_idx, value, deadline=None):
 
-        if HYDROCAPT_EXTERNAL_TO_INTERNAL_CONSIGNS.get(consign,[consign, "integer"])[1] != HYDROCAPT_TIMER:
-            return
+        deadline = HydrocaptDeadline.of(deadline)
 
-        if hour_idx < 0 or hour_idx >= 24:
+        if self._is_timer_hour_edit_valid(consign, hour_idx) is False:
             return
 
-        cur_timer = self._saved_consigns.get(consign)
-
-        if cur_timer is None:
-            self.get_current_consigns()
+        if self._saved_consigns.get(consign) is None:
+            self.get_current_consigns(deadline=deadline)
 
-        cur_timer = self._saved_consigns.get(consign)
+        cur_timer = self._get_edited_timer(consign, hour_idx, value)
 
         if cur_timer is None:
             return
 
-        cur_timer[hour_idx] = value
-
-        self.set_consign(consign, cur_timer)
+        self.set_consign(consign, cur_timer, deadline=deadline)
 
 
-    def _get_current_consigns(self) -> Dict[str, Any]:
+    def _get_current_consigns(self, deadline: Optional[HydrocaptDeadline] = None) -> Dict[str, Any]:
 
         pool_id = self._get_pool_internal_id()
 
         get_pool_command_url = f"{HYDROCAPT_GET_POOL_CONSIGN_URL}?serial={pool_id}"
 
-        commands_state = self._get_session().get(get_pool_command_url)
+        commands_state = self._get_session().get(get_pool_command_url, deadline=deadline)
 
-        tree_consign_state = self._check_xml_not_authenticated(commands_state)
+        tree_consign_state = self._check_xml_not_authenticated(commands_state.content)
 
-        if tree_consign_state is None:
-            raise HydrocaptError
-
-        internal_consigns = {}
-
-        for state in HYDROCAPT_INTERNAL_TO_EXTERNAL_CONSIGNS:
-            for path in [f"/root/datas/select/{state}", f"/root/datas/timer/{state}"]:
-                try:
-                    r = tree_consign_state.xpath(path)
-                    state_val = r[0].text
-                    internal_consigns[state] = state_val
-                except Exception:
-                    pass
+        return self._parse_consigns(tree_consign_state)
 
+    def get_current_consigns(self, deadline=None) -> Dict[str, Any]:
 
-        return self._get_hydrocapt_external_consign_from_internal(internal_consigns)
-
-    def get_current_consigns(self) -> Dict[str, Any]:
-
-        try:
-            states = self._get_current_consigns()
-        except Exception:
-            states = {}
-
-        if len(states) == 0:
-            self._get_session(force_reconnect=True)
-            states = self._get_current_consigns()
+        deadline = HydrocaptDeadline.of(deadline)
 
-        if len(states) == 0:
-            raise HydrocaptError("Cannot get current consigns")
+        states = self._call_with_retry(self._get_current_consigns, deadline=deadline)
 
         self._saved_consigns = states
 
         return states
 
 
-    def get_packaged_data(self):
+    def fetch_all_data(self, deadline=None):
 
-        res = {}
-
-        for k,v in self._saved_states.items():
-            res[k] = v
+        return self.fetch_data(HYDROCAPT_FAMILIES, deadline=deadline)
 
-        for k,v in self._saved_read_values.items():
-            res[k] = v
-
-        for k,v in self._saved_consigns.items():
-            res[k] = v
-
-        return res
+    def fetch_data(self, families, deadline=None):
+        """Refresh only some data families (among HYDROCAPT_FAMILIES), the others keep their last read values."""
 
+        deadline = HydrocaptDeadline.of(deadline)
 
-    def fetch_all_data(self):
-        self.get_commands_current_states()
-        self.get_pool_measure_latest()
-        self.get_current_consigns()
+        if HYDROCAPT_FAMILY_COMMANDS in families:
+            self.get_commands_current_states(deadline=deadline)
+        if HYDROCAPT_FAMILY_MEASURES in families:
+            self.get_pool_measure_latest(deadline=deadline)
+        if HYDROCAPT_FAMILY_SETPOINTS in families:
+            self.get_current_consigns(deadline=deadline)
         return self.get_packaged_data()
 
 
@@ -46,6 +46,32 @@ for k_ext, v_trad in HYDROCAPT_EXTERNAL_TO_INTERNAL_CONSIGNS.items():
         HYDROCAPT_TIMERS[k_ext] = v_trad[2]
 
 
+#getJsonValues record typeInfo to measure name, missing hourly values are placeholders like "--.-"
+HYDROCAPT_HISTORY_MEASURES = {"WATER_TEMP":"water_temperature", "AIR_TEMP":"technical_room_temperature", "PH":"ph", "CONDUCTIVITY":"conductivity", "ORP":"redox"} #redox is ORP
+#period covered by one getJsonValues answer, the date parameter being in that period
+HYDROCAPT_HISTORY_TYPE_DATES = ["day", "week", "month"]
+
+#data families, refreshed independently with fetch_data
+HYDROCAPT_FAMILY_COMMANDS = "commands"
+HYDROCAPT_FAMILY_MEASURES = "measures"
+HYDROCAPT_FAMILY_SETPOINTS = "setpoints"
+HYDROCAPT_FAMILIES = [HYDROCAPT_FAMILY_COMMANDS, HYDROCAPT_FAMILY_MEASURES, HYDROCAPT_FAMILY_SETPOINTS]
+
+#circuit breaker: consecutive network / server failures opening it, and how long it stays open
+HYDROCAPT_CIRCUIT_FAILURE_THRESHOLD = 5
+HYDROCAPT_CIRCUIT_RESET_TIMEOUT_S = 300
+
+#max number of requests in flight at the same time on one authenticated session
+HYDROCAPT_DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+
+#alarm thresholds (min / max of ph, redox, conductivity) are set by hand in the hydrocapt app and
+#almost never change: they are read again only once this old, 0 to read them on every refresh
+HYDROCAPT_DEFAULT_ALARMS_CACHE_TTL_S = 6*3600
+
+#timer hour edits of one timer made within this window are sent as a single setpoint save
+HYDROCAPT_DEFAULT_TIMER_COALESCE_WINDOW_S = 2.0
+
+
 HYDROCAPT_LOGIN_URL = "https://www.hydrocapt.fr/pool/poolLogin/login"
 HYDROCAPT_DISCONNECT_URL = "https://www.hydrocapt.fr/pool/poolLogin/disconnect"
 HYDROCAPT_EDIT_POOL_OWN_URL = "https://www.hydrocapt.fr/pool/poolEdit/own"
@@ -58,4 +84,17 @@ HYDROCAPT_GET_ALARMS_URL = "https://www.hydrocapt.fr/pool/ajaxAlarms/get"
 HYDROCAPT_AJAX_POOL_HISTORIC = "https://www.hydrocapt.fr/pool/poolHistoric"
 
 HYDROCAPT_GET_POOL_CONSIGN_URL = "https://www.hydrocapt.fr/pool/ajaxSetpoints/get"
-HYDROCAPT_SAVE_POOL_CONSIGN_URL = "https://www.hydrocapt.fr/pool/ajaxSetpoints/save"
\ No newline at end of file
+HYDROCAPT_SAVE_POOL_CONSIGN_URL = "https://www.hydrocapt.fr/pool/ajaxSetpoints/save"
+
+#(connect, read) timeouts in seconds per endpoint, any other url uses HYDROCAPT_DEFAULT_TIMEOUT
+HYDROCAPT_DEFAULT_TIMEOUT = (10.0, 20.0)
+HYDROCAPT_DEFAULT_TIMEOUTS = {
+  HYDROCAPT_LOGIN_URL: (10.0, 30.0),
+  HYDROCAPT_EDIT_POOL_OWN_URL: (10.0, 30.0),
+  HYDROCAPT_AJAX_VALUES_HISTORY: (10.0, 30.0),
+  HYDROCAPT_GET_ALARMS_URL: (10.0, 20.0),
+  HYDROCAPT_GET_POOL_COMMAND_URL: (10.0, 20.0),
+  HYDROCAPT_SAVE_POOL_COMMAND_URL: (10.0, 20.0),
+  HYDROCAPT_GET_POOL_CONSIGN_URL: (10.0, 20.0),
+  HYDROCAPT_SAVE_POOL_CONSIGN_URL: (10.0, 20.0),
+}
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Overall time budget shared by all the requests of one Hydrocapt operation."""
+import time
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from .exceptions import HydrocaptDeadlineError
+
+from .const import HYDROCAPT_DEFAULT_TIMEOUT, HYDROCAPT_DEFAULT_TIMEOUTS
+
+
+def get_endpoint_timeout(url: str, timeouts: Optional[dict] = None) -> Tuple[float, float]:
+    """Return the (connect, read) timeouts of the endpoint of url, query string ignored."""
+    endpoint = url.split("?", 1)[0]
+    if timeouts is not None and endpoint in timeouts:
+        return timeouts[endpoint]
+    return HYDROCAPT_DEFAULT_TIMEOUTS.get(endpoint, HYDROCAPT_DEFAULT_TIMEOUT)
+
+
+class HydrocaptDeadline(object):
+    """Absolute deadline, propagated to every request and wait of an operation."""
+
+    def __init__(self, budget_s: Optional[float] = None) -> None:
+        """Start the budget now.
+
+        Args:
+            budget_s: seconds allowed for the whole operation, None for no deadline
+        """
+        if budget_s is None:
+            self._end = None
+        else:
+            self._end = time.monotonic() + budget_s
+
+    @classmethod
+    def of(cls, deadline: Union["HydrocaptDeadline", float, None]) -> "HydrocaptDeadline":
+        """Accept either an existing deadline, a budget in seconds or None."""
+        if isinstance(deadline, HydrocaptDeadline):
+            return deadline
+        return cls(deadline)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, None if there is no deadline."""
+        if self._end is None:
+            return None
+        return max(0.0, self._end - time.monotonic())
+
+    def check(self):
+        """Raise if the budget is exhausted, to stop the remaining work."""
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0.0:
+            raise HydrocaptDeadlineError("Hydrocapt deadline exceeded")
+
+    def clamp(self, timeout: Tuple[float, float]) -> Tuple[float, float]:
+        """Shorten (connect, read) timeouts so that a request can't outlive the deadline."""
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return (min(timeout[0], remaining), min(timeout[1], remaining))
+
+    def sleep(self, duration_s: float):
+        """Sleep, but raise instead of waking up after the deadline."""
+        remaining = self.remaining()
+        if remaining is not None and remaining < duration_s:
+            raise HydrocaptDeadlineError("Hydrocapt deadline exceeded")
+        time.sleep(duration_s)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Decoding of the Hydrocapt XML answers, with a reused parser and precompiled XPath."""
+import threading
+from typing import Dict
+from typing import List
+
+from lxml import etree
+
+
+#status of every XML answer: OK, an error, or the not authenticated message
+STATUS_XPATH = etree.XPath("/root/status")
+
+#all the fields of the commands and setpoints answers, in one evaluation
+DATAS_FIELDS_XPATH = etree.XPath("/root/datas/* | /root/datas/select/* | /root/datas/timer/*")
+
+DATAS = "datas"
+
+_parsers = threading.local()
+
+
+def get_xml_parser() -> etree.XMLParser:
+    """Parser of the current thread, lxml parsers can't be shared between threads.
+
+    Hardened: no entity expansion, no DTD and no network access, the answers never need them.
+    """
+    parser = getattr(_parsers, "parser", None)
+    if parser is None:
+        parser = etree.XMLParser(
+            resolve_entities=False,
+            no_network=True,
+            load_dtd=False,
+            huge_tree=False,
+            remove_blank_text=True,
+        )
+        _parsers.parser = parser
+    return parser
+
+
+def parse_xml(content):
+    """Parse an answer, preferably the bytes of the body: a str is encoded again by lxml, and refused if
+    it has an encoding declaration."""
+    return etree.fromstring(content, get_xml_parser())
+
+
+def contains_text(content, text: str) -> bool:
+    """Look for an ascii message in a body, bytes or str, without decoding it."""
+    if isinstance(content, (bytes, bytearray)):
+        return text.encode("ascii") in content
+    return text in content
+
+
+NOT_AUTHENTICATED = "You are not authenticated"
+
+
+def parse_status(content):
+    """Parse an answer body, bytes as received: lxml reads them with the encoding they declare.
+
+    Returns:
+        The status nodes (None if the answer has none), the tree (None if the answer isn't xml), and the
+        status text, or the raw body when there is no status to look at
+    """
+    try:
+        tree = parse_xml(content)
+    except Exception:
+        return None, None, content
+
+    status = STATUS_XPATH(tree)
+    if status is not None and len(status) > 0:
+        return status, tree, status[0].text or ""
+
+    return None, tree, content
+
+
+def is_not_authenticated(to_probe) -> bool:
+    """True when the status text, or the raw body of an answer without status, tells the session expired."""
+    return contains_text(to_probe, NOT_AUTHENTICATED)
+
+
+def get_datas_fields(tree) -> Dict[str, Dict[str, str]]:
+    """Every field of an answer, walking its datas once.
+
+    Returns:
+        For each parent (datas, select or timer), the text of its fields by tag, the first one kept
+        when a tag is repeated
+    """
+    fields = {DATAS: {}, "select": {}, "timer": {}}
+    for node in DATAS_FIELDS_XPATH(tree):
+        parent = node.getparent().tag
+        if not isinstance(node.tag, str) or parent not in fields:
+            continue
+        fields[parent].setdefault(node.tag, node.text)
+    return fields
+
+
+#read size of the streamed pool page, the serial is near its beginning
+POOL_PAGE_CHUNK_SIZE = 8192
+
+
+class HydrocaptPoolSerialScanner(object):
+    """Find the pool serials of the poolEdit page while it is downloaded.
+
+    The page is fed by chunks to an incremental HTML parser that only reports the input tags, so the
+    download can stop at the first serial instead of reading and parsing the whole page.
+    """
+
+    def __init__(self, first_only: bool = True) -> None:
+        """Args:
+            first_only: done at the first serial, else collect the serials of all the pools of the account
+        """
+        self.first_only = first_only
+        self.serials: List[int] = []
+        self._parser = etree.HTMLPullParser(events=("start",), tag="input")
+        self.done = False
+
+    def _read_events(self):
+        for _, node in self._parser.read_events():
+            if node.get("name") != "serial":
+                continue
+            try:
+                serial = int(node.get("value"))
+            except (TypeError, ValueError):
+                continue
+            if serial not in self.serials:
+                self.serials.append(serial)
+            if self.first_only:
+                self.done = True
+                return
+
+    def feed(self, chunk: bytes) -> bool:
+        """Parse the next chunk of the page.
+
+        Returns:
+            True once there is nothing more to look for, the rest of the page can be dropped
+        """
+        if self.done is False:
+            self._parser.feed(chunk)
+            self._read_events()
+        return self.done
+
+    def close(self) -> List[int]:
+        """End of the page, returns the serials found, in page order."""
+        if self.done is False:
+            try:
+                self._parser.close()
+            except etree.LxmlError:
+                pass
+            self._read_events()
+            self.done = True
+        return self.serials
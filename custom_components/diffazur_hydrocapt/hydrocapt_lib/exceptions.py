@@ -12,3 +12,54 @@ class HydrocaptError(Exception):
             args: the message or root cause of the error
         """
         Exception.__init__(self, *args)
+
+
+class HydrocaptAuthError(HydrocaptError):
+    """The session is not (or no more) authenticated, or the login was refused."""
+
+
+class HydrocaptConnectionError(HydrocaptError):
+    """Transient network failure: connection refused or reset, DNS, TLS..."""
+
+
+class HydrocaptTimeoutError(HydrocaptConnectionError):
+    """A request timed out."""
+
+
+class HydrocaptDeadlineError(HydrocaptError):
+    """The overall deadline of an operation ran out, it is not retried nor counted as a cloud failure."""
+
+
+class HydrocaptServerError(HydrocaptError):
+    """The hydrocapt cloud answered with a 5xx or refused / did not apply the request."""
+
+
+class HydrocaptProtocolError(HydrocaptError):
+    """The answer could not be understood: unexpected status, format or content."""
+
+
+class HydrocaptClosedError(HydrocaptError):
+    """The client was closed, it does not send requests any more."""
+
+
+class HydrocaptCircuitOpenError(HydrocaptError):
+    """The cloud is considered down, no request is sent until the circuit breaker retry time."""
+
+    def __init__(self, retry_in_s: float) -> None:
+        """Initialize the exception.
+
+        Args:
+            retry_in_s: seconds before the circuit breaker lets a request through again
+        """
+        HydrocaptError.__init__(self, f"Hydrocapt circuit breaker open, retry in {retry_in_s:.0f}s")
+        self.retry_in_s = retry_in_s
+
+
+def check_http_status(status: int, url: str):
+    """Raise the HydrocaptError subclass matching an HTTP error status."""
+    if status in (401, 403):
+        raise HydrocaptAuthError(f"Hydrocapt HTTP {status}: {url}")
+    if status >= 500:
+        raise HydrocaptServerError(f"Hydrocapt HTTP {status}: {url}")
+    if status >= 400:
+        raise HydrocaptProtocolError(f"Hydrocapt HTTP {status}: {url}")
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""Columnar parsing of the getJsonValues history answers."""
+from array import array
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+import math
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from dateutil.parser import parse
+
+try:
+    import numpy as np
+except ImportError:
+    #numpy is optional, the arrays are then array('d') and the lookups plain loops
+    np = None
+
+from .const import HYDROCAPT_HISTORY_MEASURES
+
+
+NAN = float("nan")
+
+_EPOCH = datetime(1970, 1, 1)
+
+_NO_DATE = object()
+
+
+def _parse_date(d) -> datetime:
+    try:
+        return datetime.fromisoformat(d)
+    except (TypeError, ValueError):
+        return parse(d)
+
+
+def parse_history_dates(dates) -> List[Optional[datetime]]:
+    """Timestamps of the values of a getJsonValues answer, from its DATE record.
+
+    The DATE record gives the date of each value, repeated for all the values of a same day when they are
+    hourly (a day answer has the same date 25 times): the k-th value of a run of identical dates is taken k hours
+    after it. A date with its own time, as in longer periods, is distinct from its neighbours and kept as is.
+    Each distinct date string is parsed once.
+
+    Returns:
+        One datetime per date, None for the dates that can't be read
+    """
+    ret = []
+    prev = _NO_DATE
+    prev_date = None
+    run = 0
+    for d in dates:
+        if d == prev:
+            run += 1
+        else:
+            prev = d
+            run = 0
+            try:
+                prev_date = _parse_date(d)
+            except (TypeError, ValueError, OverflowError):
+                prev_date = None
+        ret.append(None if prev_date is None else prev_date + timedelta(hours=run))
+    return ret
+
+
+def _to_float(v) -> float:
+    #the placeholders of missing values ("--.-", "---", ...) are not numbers: no need to compare them one by one
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return NAN
+
+
+def _to_array(values):
+    if np is not None:
+        return np.fromiter((_to_float(v) for v in values), dtype=np.float64, count=len(values))
+    return array("d", (_to_float(v) for v in values))
+
+
+class HydrocaptHistoryArrays(object):
+    """All the records of a getJsonValues answer, one float column per measure, NaN where there is no value.
+
+    timestamps holds the date of each index as seconds since 1970-01-01 of the naive local date time
+    given by the cloud, NaN where the date can't be read. The columns are numpy arrays when numpy is
+    installed, array('d') otherwise.
+    """
+
+    def __init__(self, timestamps, columns: Dict[str, Any]) -> None:
+        self.timestamps = timestamps
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def get_datetime(self, idx: int) -> Optional[datetime]:
+        ts = self.timestamps[idx]
+        if math.isnan(ts):
+            return None
+        return _EPOCH + timedelta(seconds=float(ts))
+
+    def _get_valid_mask(self, name: str):
+        values = self.columns[name]
+        n = min(len(values), len(self.timestamps))
+        if np is not None:
+            return ~(np.isnan(values[:n]) | np.isnan(self.timestamps[:n]))
+        return [not (math.isnan(values[i]) or math.isnan(self.timestamps[i])) for i in range(n)]
+
+    def latest_valid_index(self, name: str) -> Optional[int]:
+        """Index of the last value of the measure, None when it has none."""
+        values = self.columns.get(name)
+        if values is None:
+            return None
+
+        if np is not None:
+            valid = np.flatnonzero(~np.isnan(values))
+            if len(valid) == 0:
+                return None
+            return int(valid[-1])
+
+        for i in range(len(values) - 1, -1, -1):
+            if not math.isnan(values[i]):
+                return i
+        return None
+
+    def get_series(self, name: str) -> List[Tuple[datetime, float]]:
+        """(date time, value) of every valid point of the measure, oldest first."""
+        if name not in self.columns:
+            return []
+
+        values = self.columns[name]
+        mask = self._get_valid_mask(name)
+
+        if np is not None:
+            idx = np.flatnonzero(mask)
+            return [
+                (_EPOCH + timedelta(seconds=ts), v)
+                for ts, v in zip(self.timestamps[idx].tolist(), values[idx].tolist())
+            ]
+
+        return [(self.get_datetime(i), values[i]) for i, ok in enumerate(mask) if ok]
+
+
+def parse_history_arrays(history, today) -> HydrocaptHistoryArrays:
+    """Turn the records of a getJsonValues answer into a HydrocaptHistoryArrays, in one pass over them.
+
+    Args:
+        history: the decoded answer
+        today: date of the values if the answer has no DATE record
+    """
+    records = history.get("records", [])
+
+    dates = None
+    columns = {}
+    for r in records:
+        cur_c = r.get("typeInfo", "NOT A VALUE")
+        if cur_c == "DATE":
+            dates = r.get("values")
+        elif cur_c in HYDROCAPT_HISTORY_MEASURES:
+            columns[HYDROCAPT_HISTORY_MEASURES[cur_c]] = _to_array(r.get("values", []))
+
+    if dates is None:
+        dates = [today]*max([len(c) for c in columns.values()] + [25])
+
+    ts = [NAN if d is None else (d - _EPOCH).total_seconds() for d in parse_history_dates(dates)]
+    if np is not None:
+        timestamps = np.array(ts, dtype=np.float64)
+    else:
+        timestamps = array("d", ts)
+
+    return HydrocaptHistoryArrays(timestamps, columns)
+
+
+def get_history_periods(start: date, end: date, type_date: str) -> List[date]:
+    """First day of each day, week (starting on monday) or month period overlapping [start, end]."""
+    if type_date == "week":
+        cur = start - timedelta(days=start.weekday())
+    elif type_date == "month":
+        cur = start.replace(day=1)
+    else:
+        cur = start
+
+    periods = []
+    while cur <= end:
+        periods.append(cur)
+        cur = get_next_history_period(cur, type_date)
+    return periods
+
+
+def get_next_history_period(period: date, type_date: str) -> date:
+    """First day of the period following the one starting on period."""
+    if type_date == "week":
+        return period + timedelta(days=7)
+    if type_date == "month":
+        return (period.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return period + timedelta(days=1)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Retry policies per error class and circuit breaker for the Hydrocapt API."""
+import random
+import threading
+import time
+from typing import Dict
+from typing import Optional
+from typing import Type
+
+from .exceptions import HydrocaptError
+from .exceptions import HydrocaptAuthError
+from .exceptions import HydrocaptConnectionError
+from .exceptions import HydrocaptServerError
+from .exceptions import HydrocaptProtocolError
+from .exceptions import HydrocaptCircuitOpenError
+
+from .const import HYDROCAPT_CIRCUIT_FAILURE_THRESHOLD
+from .const import HYDROCAPT_CIRCUIT_RESET_TIMEOUT_S
+
+
+class HydrocaptRetryPolicy(object):
+    """How an operation is retried after a given class of error."""
+
+    def __init__(self, max_attempts: int = 1, base_delay_s: float = 0.0, max_delay_s: float = 0.0, relogin: bool = False) -> None:
+        """Initialize.
+
+        Args:
+            max_attempts: total number of attempts, 1 means no retry
+            base_delay_s: first backoff delay, doubled at each new attempt
+            max_delay_s: cap of the backoff delay
+            relogin: login again before the next attempt
+        """
+        self.max_attempts = max_attempts
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+        self.relogin = relogin
+
+    def get_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter before attempt number attempt (1 for the first retry)."""
+        if self.base_delay_s <= 0.0:
+            return 0.0
+        cap = min(self.max_delay_s, self.base_delay_s * (2 ** (attempt - 1)))
+        return random.uniform(cap / 2.0, cap)
+
+
+NO_RETRY_POLICY = HydrocaptRetryPolicy()
+
+#reads are idempotent: retry transient failures with backoff
+HYDROCAPT_READ_RETRY_POLICIES: Dict[Type[HydrocaptError], HydrocaptRetryPolicy] = {
+    HydrocaptAuthError: HydrocaptRetryPolicy(max_attempts=2, relogin=True),
+    HydrocaptConnectionError: HydrocaptRetryPolicy(max_attempts=3, base_delay_s=1.0, max_delay_s=8.0),
+    HydrocaptServerError: HydrocaptRetryPolicy(max_attempts=3, base_delay_s=2.0, max_delay_s=16.0),
+    HydrocaptProtocolError: NO_RETRY_POLICY,
+}
+
+#a write not confirmed by the cloud is not sent again, only auth and network failures are retried
+HYDROCAPT_WRITE_RETRY_POLICIES: Dict[Type[HydrocaptError], HydrocaptRetryPolicy] = {
+    HydrocaptAuthError: HydrocaptRetryPolicy(max_attempts=2, relogin=True),
+    HydrocaptConnectionError: HydrocaptRetryPolicy(max_attempts=2, base_delay_s=1.0, max_delay_s=4.0),
+    HydrocaptServerError: NO_RETRY_POLICY,
+    HydrocaptProtocolError: NO_RETRY_POLICY,
+}
+
+
+def get_retry_policy(exc: HydrocaptError, policies: Dict[Type[HydrocaptError], HydrocaptRetryPolicy]) -> HydrocaptRetryPolicy:
+    """Return the policy of the most specific error class of exc."""
+    for cls in type(exc).__mro__:
+        policy = policies.get(cls)
+        if policy is not None:
+            return policy
+    return NO_RETRY_POLICY
+
+
+class HydrocaptCircuitBreaker(object):
+    """Stop calling the cloud after repeated network / server failures.
+
+    closed: requests go through, consecutive outage failures are counted
+    open: requests fail fast with HydrocaptCircuitOpenError until reset_timeout_s elapsed
+    half_open: one trial request goes through, its outcome closes or re-opens the circuit
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = HYDROCAPT_CIRCUIT_FAILURE_THRESHOLD, reset_timeout_s: float = HYDROCAPT_CIRCUIT_RESET_TIMEOUT_S) -> None:
+        """Initialize.
+
+        Args:
+            failure_threshold: consecutive outage failures opening the circuit
+            reset_timeout_s: time the circuit stays open before a trial request
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        #token of the half-open trial in flight, None when there is none
+        self._trial: Optional[object] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._get_state()
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    def retry_in(self) -> float:
+        """Seconds before a trial request is allowed, 0 if not open."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout_s - time.monotonic())
+
+    def _get_state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at < self.reset_timeout_s:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def before_call(self) -> Optional[object]:
+        """Raise HydrocaptCircuitOpenError if no request should be sent now.
+
+        Returns:
+            A token when this call is the half-open trial, to give to release_trial once the call is over, None otherwise
+        """
+        with self._lock:
+            state = self._get_state()
+            if state == self.CLOSED:
+                return None
+            if state == self.HALF_OPEN and self._trial is None:
+                self._trial = object()
+                return self._trial
+            retry_in_s = max(0.0, self._opened_at + self.reset_timeout_s - time.monotonic())
+        raise HydrocaptCircuitOpenError(retry_in_s)
+
+    def release_trial(self, trial: Optional[object]):
+        """End the trial of token trial if its outcome was never recorded (cancelled, unexpected error).
+
+        The circuit stays half-open and the next call becomes the trial. No-op for None or a trial already recorded.
+        """
+        with self._lock:
+            if trial is not None and self._trial is trial:
+                self._trial = None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = None
+
+    def record_failure(self, exc: BaseException):
+        """Count network and server failures only, an auth or parse error says the cloud is up.
+
+        Running out of the deadline budget says nothing about the cloud and is not counted either.
+        """
+        with self._lock:
+            if not isinstance(exc, (HydrocaptConnectionError, HydrocaptServerError)):
+                self._trial = None
+                return
+            self._failures += 1
+            if self._trial is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial = None
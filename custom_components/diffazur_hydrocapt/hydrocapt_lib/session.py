@@ -3,6 +3,8 @@
 #from urllib.parse import quote_plus
 
 
+import threading
+
 import requests
 from requests import Session
 
@@ -11,9 +13,10 @@ from typing import Dict
 from typing import List
 from typing import Optional
 
-from .exceptions import HydrocaptError
-
-from lxml import html
+from .exceptions import HydrocaptError, HydrocaptAuthError, HydrocaptConnectionError, HydrocaptTimeoutError
+from .exceptions import check_http_status
+from .deadline import HydrocaptDeadline, get_endpoint_timeout
+from .decoding import HydrocaptPoolSerialScanner, POOL_PAGE_CHUNK_SIZE
 
 from .const import HYDROCAPT_LOGIN_URL
 from .const import HYDROCAPT_DISCONNECT_URL
@@ -25,24 +28,54 @@ class HydrocaptClientSession(object):
     """
 
 
-    def __init__(self, username: str, password: str, pool_internal_id :int = -1) -> None:
+    def __init__(self, username: str, password: str, pool_internal_id :int = -1, timeouts: Optional[Dict[str, Any]] = None) -> None:
         """Initialize and authenticate.
 
         Args:
             username: the hydrocapt registered user
             password: the hydrocapt user's password
+            timeouts: per endpoint (connect, read) timeouts overriding HYDROCAPT_DEFAULT_TIMEOUTS
         """
 
         self.username = username
         self.password = password
         self._session : Optional[Session] = None
+        #requests session kept for the lifetime of this object: its connection pool survives the re-logins
+        self._transport : Optional[Session] = None
         self._pool_internal_id = pool_internal_id
+        self._timeouts = timeouts
+        #single-flight login: concurrent callers wait for one login and share its result
+        self._login_lock = threading.Lock()
+        self._login_generation = 0
+
+
+    def _get_timeout(self, url, deadline: Optional[HydrocaptDeadline] = None):
+        timeout = get_endpoint_timeout(url, self._timeouts)
+        if deadline is not None:
+            timeout = deadline.clamp(timeout)
+        return timeout
+
+    def _get_transport(self) -> Session:
+        if self._transport is None:
+            self._transport = requests.session()
+        return self._transport
 
+    def close(self):
+        """Close the pooled connections, a later request logs in again on a new transport."""
+        with self._login_lock:
+            transport = self._transport
+            self._transport = None
+            self._session = None
+        if transport is not None:
+            transport.close()
 
-    def _new_session(self) -> Session:
+    def _new_session(self, deadline: Optional[HydrocaptDeadline] = None) -> Session:
 
 
-        session_requests = requests.session()
+        session_requests = self._get_transport()
+
+        #forget any previous authentication before login again, the pooled connections are kept
+        session_requests.cookies.clear()
 
 
         #use quote, from urllib.parse import quote, or quote_plus here for the strings?
@@ -51,39 +84,85 @@ class HydrocaptClientSession(object):
             "pass": self.password,
         }
 
-        result = session_requests.post(
+        self._request(
+            "POST",
             HYDROCAPT_LOGIN_URL,
             data=payload,
-            headers=dict(referer=HYDROCAPT_DISCONNECT_URL)
+            headers=dict(referer=HYDROCAPT_DISCONNECT_URL),
+            deadline=deadline,
+            session_requests=session_requests,
         )
 
-        result.raise_for_status()
-
         if self._pool_internal_id < 0:
 
+            serials = self._scan_pool_serials(True, deadline, session_requests)
 
-            result_edit_pool = session_requests.get(
-                HYDROCAPT_EDIT_POOL_OWN_URL,
-            )
+            if len(serials) == 0:
+                #the pool page has no serial when the login was refused
+                raise HydrocaptAuthError("Hydrocapt Diffazur: Can't get pool id")
 
-            result_edit_pool.raise_for_status()
+            self._pool_internal_id = serials[0]
 
-            tree = html.fromstring(result_edit_pool.text)
+        return session_requests
 
-            try:
-                pool_id = int(list(set(tree.xpath("//input[@name='serial']/@value")))[0])
+    def _scan_pool_serials(self, first_only: bool = True, deadline: Optional[HydrocaptDeadline] = None, session_requests: Optional[Session] = None) -> List[int]:
+        """Stream the pool page, stopping as soon as the scanner found what it looks for."""
 
-            except:
-                raise HydrocaptError("Hydrocapt Diffazur: Can't get pool id")
+        ret = self._request(
+            "GET",
+            HYDROCAPT_EDIT_POOL_OWN_URL,
+            deadline=deadline,
+            session_requests=session_requests,
+            stream=True,
+        )
 
-            self._pool_internal_id = pool_id
+        scanner = HydrocaptPoolSerialScanner(first_only)
+        try:
+            for chunk in ret.iter_content(POOL_PAGE_CHUNK_SIZE):
+                if scanner.feed(chunk):
+                    break
+        except requests.RequestException as exc:
+            raise HydrocaptConnectionError(f"Hydrocapt request failed: {HYDROCAPT_EDIT_POOL_OWN_URL}: {exc}") from exc
+        finally:
+            #drops the rest of the page if the scan stopped early
+            ret.close()
 
-        return session_requests
+        return scanner.close()
+
+    def get_pool_serials(self, deadline: Optional[HydrocaptDeadline] = None) -> List[int]:
+        """Serials of all the pools of the account, read in one pass over the pool page."""
+
+        self._login_if_no_session(deadline)
+
+        return self._scan_pool_serials(False, deadline)
+
+    @property
+    def login_generation(self) -> int:
+        """Incremented on each login, to be read before a request that may need a relogin."""
+        return self._login_generation
+
+    def relogin(self, failed_generation: Optional[int] = None, deadline: Optional[HydrocaptDeadline] = None):
+        """Login again, once for all the callers that saw the same failure.
+
+        Args:
+            failed_generation: login_generation read before the failed request, if a login happened
+                since then the session is already fresh and nothing is done
+            deadline: overall deadline of the operation that needs the login
+        """
+        with self._login_lock:
+            if failed_generation is not None and failed_generation != self._login_generation:
+                return
+            self._session = self._new_session(deadline)
+            self._login_generation += 1
+
+    def _login_if_no_session(self, deadline: Optional[HydrocaptDeadline] = None):
+        if self._session is None:
+            self.relogin(self._login_generation, deadline)
 
     def get_internal_pool_id(self):
 
         if self._pool_internal_id < 0 or self._session is None:
-            self._session = self._new_session()
+            self.relogin(self._login_generation)
 
         return self._pool_internal_id
 
@@ -95,43 +174,47 @@ class HydrocaptClientSession(object):
 
         return False
 
-    def post(self, url, data, headers=None):
+    def _request(self, method, url, data=None, headers=None, deadline: Optional[HydrocaptDeadline] = None, session_requests: Optional[Session] = None, stream: bool = False):
 
-        if self._session is None:
-            self._session = self._new_session()
+        if session_requests is None:
+            session_requests = self._session
 
+        try:
+            ret = session_requests.request(method, url, data=data, headers=headers, timeout=self._get_timeout(url, deadline), stream=stream)
+        except requests.Timeout as exc:
+            #a timeout shortened by the deadline is the budget running out, not the cloud being slow
+            if deadline is not None:
+                deadline.check()
+            raise HydrocaptTimeoutError(f"Hydrocapt request timed out: {url}") from exc
+        except requests.RequestException as exc:
+            raise HydrocaptConnectionError(f"Hydrocapt request failed: {url}: {exc}") from exc
 
-        if headers is None:
-            headers = {}
+        try:
+            check_http_status(ret.status_code, url)
+        except HydrocaptError:
+            #nobody else gets the response to close: give a streamed connection back to the pool
+            ret.close()
+            raise
 
-        if headers.get("referer") is None:
-            headers["referer"] = url
+        return ret
 
-        try:
-            ret = self._session.post(url, data=data, headers=headers)
-            ret.raise_for_status()
-        except:
-            self._session = self._new_session()
-            ret = self._session.post(url, data=data, headers=headers)
+    def post(self, url, data, headers=None, deadline: Optional[HydrocaptDeadline] = None):
+        """Single POST, errors are raised as HydrocaptError subclasses, retries are up to the caller."""
 
-        ret.raise_for_status()
+        self._login_if_no_session(deadline)
 
 
-        return ret
+        if headers is None:
+            headers = {}
 
-    def get(self, url):
+        if headers.get("referer") is None:
+            headers["referer"] = url
 
-        if self._session is None:
-            self._session = self._new_session()
+        return self._request("POST", url, data=data, headers=headers, deadline=deadline)
 
-        ret = None
-        try:
-            ret = self._session.get(url)
-            ret.raise_for_status()
-        except:
-            self._session = self._new_session()
-            ret = self._session.get(url)
+    def get(self, url, deadline: Optional[HydrocaptDeadline] = None):
+        """Single GET, errors are raised as HydrocaptError subclasses, retries are up to the caller."""
 
-        ret.raise_for_status()
+        self._login_if_no_session(deadline)
 
-        return ret
+        return self._request("GET", url, deadline=deadline)
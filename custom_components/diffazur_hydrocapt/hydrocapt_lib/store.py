@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""Local columnar store of the hourly pool measures, one memory mapped file per pool."""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from datetime import timedelta
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from .history import HydrocaptHistoryArrays, np, NAN
+
+from .const import HYDROCAPT_HISTORY_MEASURES
+
+
+_MAGIC = b"HCTS0001"
+#magic, number of metrics, capacity (rows), count (rows used)
+_HEADER = struct.Struct("<8sIII")
+_NAME_SIZE = 32
+_ITEM_SIZE = 8
+_INITIAL_CAPACITY = 24*31
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_hour(date_time: datetime) -> int:
+    return int((date_time - _EPOCH).total_seconds() // 3600)
+
+
+class HydrocaptSeriesStore(object):
+    """Append only store of hourly measures.
+
+    The file holds a header, then one fixed width column per metric after the hour column:
+    the hours since 1970-01-01 of the naive local date times of the cloud (int64, increasing), and the
+    measures (float64, NaN when missing). Columns are preallocated to a capacity, doubled when full.
+    Hours newer than the last one are appended, the missing measures of an existing hour can be filled
+    in, older hours are never inserted.
+
+    Not safe to share between processes, the methods of one instance are serialized by a lock.
+    """
+
+    def __init__(self, path: str, metrics: Optional[List[str]] = None) -> None:
+        """Open the store, created if missing.
+
+        Args:
+            path: the file of the pool
+            metrics: the columns of a new store, all the history measures by default, an existing store
+                keeps its own
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+        if metrics is None:
+            metrics = list(HYDROCAPT_HISTORY_MEASURES.values())
+
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            self._create(path, metrics)
+
+        self._file = open(path, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+
+        magic, num_metrics, self._capacity, self._count = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a Hydrocapt series store")
+
+        self.metrics = []
+        for i in range(num_metrics):
+            off = _HEADER.size + i*_NAME_SIZE
+            self.metrics.append(self._mm[off:off + _NAME_SIZE].rstrip(b"\0").decode("utf-8"))
+
+        #in memory copy of the hour column, to search it without going through the mmap
+        self._hours = array("q")
+        self._hours.frombytes(self._mm[self._get_column_offset(-1):self._get_column_offset(-1) + self._count*_ITEM_SIZE])
+        if sys.byteorder != "little":
+            self._hours.byteswap()
+
+    @staticmethod
+    def _get_data_offset(num_metrics: int) -> int:
+        return _HEADER.size + num_metrics*_NAME_SIZE + (-(_HEADER.size + num_metrics*_NAME_SIZE) % _ITEM_SIZE)
+
+    def _create(self, path: str, metrics: List[str]):
+        size = self._get_data_offset(len(metrics)) + (len(metrics) + 1)*_INITIAL_CAPACITY*_ITEM_SIZE
+        header = bytearray(self._get_data_offset(len(metrics)))
+        _HEADER.pack_into(header, 0, _MAGIC, len(metrics), _INITIAL_CAPACITY, 0)
+        for i, m in enumerate(metrics):
+            name = m.encode("utf-8")[:_NAME_SIZE]
+            header[_HEADER.size + i*_NAME_SIZE:_HEADER.size + i*_NAME_SIZE + len(name)] = name
+
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(header)
+            f.truncate(size)
+
+    def _get_column_offset(self, idx: int, capacity: Optional[int] = None) -> int:
+        """Offset of a metric column, -1 for the hour column."""
+        if capacity is None:
+            capacity = self._capacity
+        return self._get_data_offset(len(self.metrics)) + (idx + 1)*capacity*_ITEM_SIZE
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.flush()
+                self._mm.close()
+                self._mm = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def last_time(self) -> Optional[datetime]:
+        """Date time of the last stored hour."""
+        if self._count == 0:
+            return None
+        return self._to_datetime(self._hours[-1])
+
+    @staticmethod
+    def _to_datetime(hour: int) -> datetime:
+        return _EPOCH + timedelta(hours=hour)
+
+    def _grow(self, min_capacity: int):
+        capacity = self._capacity
+        while capacity < min_capacity:
+            capacity *= 2
+
+        self._mm.resize(self._get_column_offset(len(self.metrics), capacity))
+
+        #the columns move to higher offsets: move the last one first to not overwrite the others
+        for idx in range(len(self.metrics) - 1, -2, -1):
+            self._mm.move(self._get_column_offset(idx, capacity), self._get_column_offset(idx), self._count*_ITEM_SIZE)
+
+        self._capacity = capacity
+        self._write_header()
+
+    def _write_header(self):
+        _HEADER.pack_into(self._mm, 0, _MAGIC, len(self.metrics), self._capacity, self._count)
+
+    def _read_item(self, idx: int, row: int) -> float:
+        return struct.unpack_from("<d", self._mm, self._get_column_offset(idx) + row*_ITEM_SIZE)[0]
+
+    def _write_item(self, idx: int, row: int, value: float):
+        struct.pack_into("<d", self._mm, self._get_column_offset(idx) + row*_ITEM_SIZE, value)
+
+    def append_series(self, series: Dict[str, List[Tuple[datetime, float]]]) -> int:
+        """Write the points of a history answer, see get_hourly_series and get_pool_history_series of the clients.
+
+        Returns:
+            The number of hours appended
+        """
+        by_hour = {}
+        for metric, points in series.items():
+            if metric not in self.metrics:
+                continue
+            idx = self.metrics.index(metric)
+            for date_time, value in points:
+                by_hour.setdefault(_to_hour(date_time), {})[idx] = value
+
+        with self._lock:
+            last = self._hours[-1] if self._count > 0 else None
+
+            new_hours = sorted(h for h in by_hour if last is None or h > last)
+            if self._count + len(new_hours) > self._capacity:
+                self._grow(self._count + len(new_hours))
+
+            #fill the values the cloud didn't have yet when the hour was stored
+            for hour, values in by_hour.items():
+                if last is None or hour > last:
+                    continue
+                row = bisect_left(self._hours, hour)
+                if row == self._count or self._hours[row] != hour:
+                    continue
+                for idx, value in values.items():
+                    if math.isnan(self._read_item(idx, row)):
+                        self._write_item(idx, row, value)
+
+            for hour in new_hours:
+                row = self._count
+                struct.pack_into("<q", self._mm, self._get_column_offset(-1) + row*_ITEM_SIZE, hour)
+                values = by_hour[hour]
+                for idx in range(len(self.metrics)):
+                    self._write_item(idx, row, values.get(idx, NAN))
+                self._hours.append(hour)
+                self._count += 1
+
+            self._write_header()
+
+        return len(new_hours)
+
+    def _read_column(self, idx: int, start_row: int, end_row: int):
+        off = self._get_column_offset(idx) + start_row*_ITEM_SIZE
+        n = end_row - start_row
+        if np is not None:
+            return np.frombuffer(self._mm, dtype="<i8" if idx < 0 else "<f8", count=n, offset=off).copy()
+        a = array("q" if idx < 0 else "d")
+        a.frombytes(self._mm[off:off + n*_ITEM_SIZE])
+        if sys.byteorder != "little":
+            a.byteswap()
+        return a
+
+    def query(self, start: Optional[datetime] = None, end: Optional[datetime] = None, metrics: Optional[List[str]] = None) -> HydrocaptHistoryArrays:
+        """Hours in [start, end], both optional.
+
+        Returns:
+            The timestamps and a column per requested metric, as a HydrocaptHistoryArrays
+        """
+        if metrics is None:
+            metrics = self.metrics
+
+        with self._lock:
+            start_row = 0 if start is None else bisect_left(self._hours, _to_hour(start))
+            end_row = self._count if end is None else bisect_right(self._hours, _to_hour(end))
+            end_row = max(start_row, end_row)
+
+            hours = self._read_column(-1, start_row, end_row)
+            columns = {m: self._read_column(self.metrics.index(m), start_row, end_row) for m in metrics}
+
+        if np is not None:
+            timestamps = hours.astype(np.float64)*3600
+        else:
+            timestamps = array("d", (h*3600.0 for h in hours))
+
+        return HydrocaptHistoryArrays(timestamps, columns)
+
+    def downsample(self, bucket_hours: int, start: Optional[datetime] = None, end: Optional[datetime] = None, metrics: Optional[List[str]] = None, how: str = "mean") -> HydrocaptHistoryArrays:
+        """Aggregate [start, end] in buckets of bucket_hours hours, aligned on 1970-01-01, missing values ignored.
+
+        Args:
+            how: mean, min or max
+        """
+        if how not in ("mean", "min", "max"):
+            raise ValueError(f"Unknown aggregation {how}, expected mean, min or max")
+
+        data = self.query(start, end, metrics)
+        bucket_s = bucket_hours*3600.0
+
+        if np is not None:
+            buckets = np.floor_divide(data.timestamps, bucket_s)
+            keys, inverse = np.unique(buckets, return_inverse=True)
+            columns = {}
+            for m, values in data.columns.items():
+                valid = ~np.isnan(values)
+                if how == "mean":
+                    sums = np.bincount(inverse[valid], weights=values[valid], minlength=len(keys))
+                    counts = np.bincount(inverse[valid], minlength=len(keys))
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        columns[m] = np.where(counts > 0, sums/np.maximum(counts, 1), np.nan)
+                else:
+                    out = np.full(len(keys), np.inf if how == "min" else -np.inf)
+                    (np.minimum if how == "min" else np.maximum).at(out, inverse[valid], values[valid])
+                    columns[m] = np.where(np.isinf(out), np.nan, out)
+            return HydrocaptHistoryArrays(keys*bucket_s, columns)
+
+        keys = []
+        rows = []
+        for i, ts in enumerate(data.timestamps):
+            key = ts//bucket_s
+            if len(keys) == 0 or keys[-1] != key:
+                keys.append(key)
+                rows.append([])
+            rows[-1].append(i)
+
+        columns = {}
+        for m, values in data.columns.items():
+            out = array("d")
+            for r in rows:
+                vals = [values[i] for i in r if not math.isnan(values[i])]
+                if len(vals) == 0:
+                    out.append(NAN)
+                elif how == "mean":
+                    out.append(sum(vals)/len(vals))
+                else:
+                    out.append(min(vals) if how == "min" else max(vals))
+            columns[m] = out
+
+        return HydrocaptHistoryArrays(array("d", (k*bucket_s for k in keys)), columns)
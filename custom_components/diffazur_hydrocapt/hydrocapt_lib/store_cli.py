@@ -0,0 +1,87 @@
+"""CLI to fill and read the local series store of a pool, see HydrocaptSeriesStore.
+
+    python store_cli.py pool.hcts import --user USER --password PASSWORD --start 2024-01-01 --type-date week
+    python store_cli.py pool.hcts query --start 2024-01-01 --end 2024-01-31 --bucket 24 --how mean
+"""
+
+if __package__ is None or len(__package__) <= 1:
+    import sys
+    from pathlib import Path
+
+    DIR = Path(__file__).resolve().parent
+    #appended: the integration modules (select, statistics) must not hide the standard library ones
+    sys.path.append(str(DIR.parent))
+    __package__ = DIR.name
+
+import argparse
+from datetime import date, datetime
+import math
+
+from .client import HydrocaptClient
+from .history import get_history_periods
+from .store import HydrocaptSeriesStore
+from .const import HYDROCAPT_HISTORY_TYPE_DATES
+
+
+def _import(store: HydrocaptSeriesStore, args):
+    hc = HydrocaptClient(args.user, args.password, pool_internal_id=args.pool_internal_id)
+
+    end = date.fromisoformat(args.end) if args.end else date.today()
+    start = date.fromisoformat(args.start) if args.start else end
+
+    #the store is append only: read the periods oldest first
+    for period in get_history_periods(start, end, args.type_date):
+        series = hc.get_pool_history_series(period, args.type_date, deadline=args.deadline)
+        appended = store.append_series(series)
+        print(f"{args.type_date} of {period}: {appended} hours appended")
+
+
+def _query(store: HydrocaptSeriesStore, args):
+    start = datetime.fromisoformat(args.start) if args.start else None
+    end = datetime.fromisoformat(args.end) if args.end else None
+    metrics = args.metrics.split(",") if args.metrics else None
+
+    if args.bucket > 1:
+        data = store.downsample(args.bucket, start, end, metrics, how=args.how)
+    else:
+        data = store.query(start, end, metrics)
+
+    names = list(data.columns)
+    print(",".join(["date_time"] + names))
+    for i in range(len(data)):
+        values = ["" if math.isnan(data.columns[n][i]) else f"{data.columns[n][i]:g}" for n in names]
+        print(",".join([data.get_datetime(i).isoformat()] + values))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local Hydrocapt series store")
+    parser.add_argument("path", help="store file of the pool")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="append the history read from the cloud")
+    p_import.add_argument("--user", required=True)
+    p_import.add_argument("--password", required=True)
+    p_import.add_argument("--pool-internal-id", type=int, default=-1)
+    p_import.add_argument("--start", help="first day, YYYY-MM-DD, the end day by default")
+    p_import.add_argument("--end", help="last day, YYYY-MM-DD, today by default")
+    p_import.add_argument("--type-date", choices=HYDROCAPT_HISTORY_TYPE_DATES, default="day")
+    p_import.add_argument("--deadline", type=float, default=120.0, help="seconds allowed for each period")
+
+    p_query = sub.add_parser("query", help="print a range as csv")
+    p_query.add_argument("--start", help="YYYY-MM-DD[THH:MM]")
+    p_query.add_argument("--end", help="YYYY-MM-DD[THH:MM]")
+    p_query.add_argument("--metrics", help="comma separated, all by default")
+    p_query.add_argument("--bucket", type=int, default=1, help="hours per row")
+    p_query.add_argument("--how", choices=["mean", "min", "max"], default="mean")
+
+    args = parser.parse_args(argv)
+
+    with HydrocaptSeriesStore(args.path) as store:
+        if args.command == "import":
+            _import(store, args)
+        else:
+            _query(store, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -71,8 +71,7 @@ class DiffazurHydrocaptLightEntity(DiffazurHydrocaptEntity, LightEntity):
 
     async def async_turn_on(self, **kwargs) -> None:
         """Turn the entity on."""
-        data = await self.hass.async_add_executor_job(
-            self.coordinator.set_command_state,
+        data = await self.coordinator.set_command_state(
             self.entity_description.key,
             self.entity_description.on_options[0],
         )
@@ -84,8 +83,7 @@ class DiffazurHydrocaptLightEntity(DiffazurHydrocaptEntity, LightEntity):
     async def async_turn_off(self, **kwargs) -> None:
         """Turn the entity off."""
 
-        data = await self.hass.async_add_executor_job(
-            self.coordinator.set_command_state,
+        data = await self.coordinator.set_command_state(
             self.entity_description.key,
             self.entity_description.off_options[0],
         )
@@ -0,0 +1,87 @@
+"""Refresh scheduling aligned on the hourly measure slots of the Hydrocapt cloud."""
+from collections import deque
+from datetime import datetime, timedelta
+import random
+import statistics
+from typing import Optional
+
+from .const import (
+    SLOT_PERIOD,
+    SLOT_DEFAULT_LAG,
+    SLOT_MARGIN,
+    SLOT_BACKOFF_MIN,
+    SLOT_BACKOFF_MAX,
+    SLOT_MIN_INTERVAL,
+)
+
+
+class HydrocaptSlotScheduler:
+    """Learn when a new hourly measure slot shows up in the cloud, and refresh just after.
+
+    The cloud history holds one value per hour, published some time after the hour. A fixed 60 minutes
+    polling can be out of phase by almost an hour: instead, the delay between a slot's date_time and the
+    refresh that first saw it is learnt, and the next refresh is planned at next slot + that delay.
+    When the slot is late, refreshes back off exponentially, with jitter, until it appears.
+
+    Times are naive local datetimes, as the date_time of the measures.
+    """
+
+    def __init__(self, history: int = 24) -> None:
+        self._last_slot: Optional[datetime] = None
+        self._lags = deque(maxlen=history)
+        self._late_refreshes = 0
+        #last refresh that didn't see the expected slot yet
+        self._last_miss: Optional[datetime] = None
+
+    @property
+    def lag(self) -> timedelta:
+        """Learnt delay between a slot date_time and its publication."""
+        if len(self._lags) == 0:
+            return SLOT_DEFAULT_LAG
+        return statistics.median(self._lags)
+
+    def expected_time(self) -> Optional[datetime]:
+        """When the next slot should be readable, None until a first slot was seen."""
+        if self._last_slot is None:
+            return None
+        return self._last_slot + SLOT_PERIOD + self.lag + SLOT_MARGIN
+
+    def observe(self, slot: Optional[datetime], now: datetime):
+        """Record the date_time of the measures returned by a refresh done at now."""
+        if slot is None:
+            return
+
+        if self._last_slot is None or slot > self._last_slot:
+            lag = now - slot
+            expected = self.expected_time()
+            if self._last_miss is not None and self._last_miss > slot:
+                #published somewhere between the last miss and now
+                lag = (self._last_miss - slot) + (now - self._last_miss) / 2
+            elif expected is not None and now >= expected:
+                #seen by the planned refresh: don't count the margin, or the lag would creep up each hour
+                lag -= SLOT_MARGIN
+            #only a refresh done within the slot period tells when it was published
+            if self._last_slot is not None and timedelta(0) <= lag < SLOT_PERIOD:
+                self._lags.append(lag)
+            self._last_slot = slot
+            self._late_refreshes = 0
+            self._last_miss = None
+            return
+
+        self._last_miss = now
+        expected = self.expected_time()
+        if expected is not None and now >= expected:
+            self._late_refreshes += 1
+
+    def next_interval(self, now: datetime) -> timedelta:
+        """Delay before the next refresh."""
+        expected = self.expected_time()
+        if expected is None:
+            return SLOT_PERIOD
+
+        if now < expected:
+            return max(SLOT_MIN_INTERVAL, expected - now)
+
+        #the slot is late: retry sooner than a whole period, spread to not hit the cloud in sync with others
+        backoff = min(SLOT_BACKOFF_MAX, SLOT_BACKOFF_MIN * (2 ** min(self._late_refreshes, 10)))
+        return max(SLOT_MIN_INTERVAL, backoff * random.uniform(0.8, 1.2))
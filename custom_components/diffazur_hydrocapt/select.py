@@ -57,8 +57,7 @@ class DiffazurHydrocaptSelectEntity(DiffazurHydrocaptEntity, SelectEntity):
 
     async def async_select_option(self, option: str) -> None:
         """Change the selected option."""
-        data = await self.hass.async_add_executor_job(
-            self.coordinator.set_command_state,
+        data = await self.coordinator.set_command_state(
             self.entity_description.key,
             option,
         )
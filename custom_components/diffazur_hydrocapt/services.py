@@ -0,0 +1,121 @@
+"""Services of the Diffazur Hydrocapt integration."""
+import voluptuous as vol
+
+from homeassistant.core import HomeAssistant, ServiceCall, callback
+from homeassistant.exceptions import ServiceValidationError
+import homeassistant.helpers.config_validation as cv
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    DOMAIN,
+    SERVICE_SET_COMMAND_STATES,
+    SERVICE_REFRESH_ALARM_THRESHOLDS,
+    ATTR_COMMANDS,
+    SERVICE_BACKFILL_HISTORY,
+    ATTR_CONFIG_ENTRY_ID,
+    ATTR_START_DATE,
+    ATTR_END_DATE,
+    ATTR_TYPE_DATE,
+    ATTR_MAX_CONCURRENT,
+    BACKFILL_TYPE_DATES,
+    DEFAULT_BACKFILL_TYPE_DATE,
+    DEFAULT_BACKFILL_MAX_CONCURRENT,
+    MAX_BACKFILL_MAX_CONCURRENT,
+)
+
+
+SET_COMMAND_STATES_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_COMMANDS): vol.All({cv.string: cv.string}, vol.Length(min=1)),
+        vol.Optional(ATTR_CONFIG_ENTRY_ID): cv.string,
+    }
+)
+
+REFRESH_ALARM_THRESHOLDS_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_CONFIG_ENTRY_ID): cv.string,
+    }
+)
+
+BACKFILL_HISTORY_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_START_DATE): cv.date,
+        vol.Optional(ATTR_END_DATE): cv.date,
+        vol.Optional(ATTR_TYPE_DATE, default=DEFAULT_BACKFILL_TYPE_DATE): vol.In(BACKFILL_TYPE_DATES),
+        vol.Optional(ATTR_MAX_CONCURRENT, default=DEFAULT_BACKFILL_MAX_CONCURRENT): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=MAX_BACKFILL_MAX_CONCURRENT)
+        ),
+        vol.Optional(ATTR_CONFIG_ENTRY_ID): cv.string,
+    }
+)
+
+
+def _get_coordinators(hass: HomeAssistant, call: ServiceCall):
+    coordinators = hass.data.get(DOMAIN, {})
+    entry_id = call.data.get(ATTR_CONFIG_ENTRY_ID)
+
+    if entry_id is None:
+        return list(coordinators.values())
+
+    if entry_id not in coordinators:
+        raise ServiceValidationError(f"Unknown Diffazur Hydrocapt config entry: {entry_id}")
+
+    return [coordinators[entry_id]]
+
+
+@callback
+def async_setup_services(hass: HomeAssistant):
+    """Register the integration services, once for all the config entries."""
+
+    async def async_set_command_states(call: ServiceCall):
+        commands = call.data[ATTR_COMMANDS]
+
+        for coordinator in _get_coordinators(hass, call):
+            ext_cmds = coordinator.get_commands_and_options()
+            for command, state in commands.items():
+                if command not in ext_cmds:
+                    raise ServiceValidationError(f"Unknown command {command}, expected one of {list(ext_cmds)}")
+                if state not in ext_cmds[command]:
+                    raise ServiceValidationError(f"Unknown state {state} for {command}, expected one of {ext_cmds[command]}")
+
+            data = await coordinator.set_command_states(commands)
+            coordinator.async_set_updated_data(data)
+
+    async def async_refresh_alarm_thresholds(call: ServiceCall):
+        for coordinator in _get_coordinators(hass, call):
+            await coordinator.async_refresh_alarm_thresholds()
+
+    async def async_backfill_history(call: ServiceCall):
+        start = call.data[ATTR_START_DATE]
+        end = call.data.get(ATTR_END_DATE, dt_util.now().date())
+        if end < start:
+            raise ServiceValidationError(f"{ATTR_END_DATE} {end} is before {ATTR_START_DATE} {start}")
+
+        for coordinator in _get_coordinators(hass, call):
+            await coordinator.async_backfill_history(
+                start, end, call.data[ATTR_TYPE_DATE], call.data[ATTR_MAX_CONCURRENT]
+            )
+
+    if not hass.services.has_service(DOMAIN, SERVICE_SET_COMMAND_STATES):
+        hass.services.async_register(
+            DOMAIN,
+            SERVICE_SET_COMMAND_STATES,
+            async_set_command_states,
+            schema=SET_COMMAND_STATES_SCHEMA,
+        )
+
+    if not hass.services.has_service(DOMAIN, SERVICE_REFRESH_ALARM_THRESHOLDS):
+        hass.services.async_register(
+            DOMAIN,
+            SERVICE_REFRESH_ALARM_THRESHOLDS,
+            async_refresh_alarm_thresholds,
+            schema=REFRESH_ALARM_THRESHOLDS_SCHEMA,
+        )
+
+    if not hass.services.has_service(DOMAIN, SERVICE_BACKFILL_HISTORY):
+        hass.services.async_register(
+            DOMAIN,
+            SERVICE_BACKFILL_HISTORY,
+            async_backfill_history,
+            schema=BACKFILL_HISTORY_SCHEMA,
+        )
@@ -0,0 +1,194 @@
+"""Import the hourly measures of the Hydrocapt cloud into the Home Assistant long term statistics."""
+import asyncio
+from datetime import date, datetime
+import logging
+
+try:
+    from diffazur_hydrocapt.hydrocapt_lib.history import get_history_periods, get_next_history_period
+except:
+    from .hydrocapt_lib.history import get_history_periods, get_next_history_period
+
+
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import async_add_external_statistics, get_last_statistics
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+try:
+    from homeassistant.components.recorder.models import StatisticMeanType
+except ImportError:
+    #older Home Assistant, only has_mean is known
+    StatisticMeanType = None
+
+from .const import DOMAIN, STATISTICS_MEASURES, BACKFILL_SAVE_DELAY, DEFAULT_BACKFILL_MAX_CONCURRENT
+from .sensor import SENSOR_TYPES
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+class HydrocaptStatisticsImporter:
+    """Write every hourly point of the measures, not only the latest one the sensors show.
+
+    The cloud returns the whole day at each refresh, the last imported hour of each statistic is kept so only
+    newer hours are written. It is read once from the recorder, then tracked in memory.
+    """
+
+    def __init__(self, hass: HomeAssistant, pool_id: int) -> None:
+        self.hass = hass
+        self.pool_id = pool_id
+        self._descriptions = {d.key: d for d in SENSOR_TYPES}
+        # statistic_id -> start of the last imported hour (aware datetime), None if nothing is stored yet
+        self._last_imported = {}
+
+    def get_statistic_id(self, key: str) -> str:
+        return f"{DOMAIN}:{key}_{self.pool_id}"
+
+    def _get_metadata(self, key: str) -> StatisticMetaData:
+        description = self._descriptions.get(key)
+        metadata = StatisticMetaData(
+            has_mean=True,
+            has_sum=False,
+            name=description.name if description is not None else key,
+            source=DOMAIN,
+            statistic_id=self.get_statistic_id(key),
+            unit_of_measurement=description.native_unit_of_measurement if description is not None else None,
+        )
+        if StatisticMeanType is not None:
+            metadata["mean_type"] = StatisticMeanType.ARITHMETIC
+        return metadata
+
+    def _to_hour_start(self, date_time: datetime) -> datetime:
+        # the cloud gives naive local times
+        if date_time.tzinfo is None:
+            date_time = date_time.replace(tzinfo=dt_util.get_default_time_zone())
+        return dt_util.as_utc(date_time).replace(minute=0, second=0, microsecond=0)
+
+    async def _async_get_last_imported(self, statistic_id: str):
+        if statistic_id in self._last_imported:
+            return self._last_imported[statistic_id]
+
+        last = await get_instance(self.hass).async_add_executor_job(
+            get_last_statistics, self.hass, 1, statistic_id, False, {"mean"}
+        )
+
+        start = None
+        rows = last.get(statistic_id)
+        if rows:
+            start = rows[0]["start"]
+            # a timestamp on recent Home Assistant versions, a datetime before
+            if not isinstance(start, datetime):
+                start = dt_util.utc_from_timestamp(start)
+
+        self._last_imported[statistic_id] = start
+        return start
+
+    async def async_import(self, series, only_new: bool = True) -> int:
+        """Import the hours not stored yet.
+
+        Args:
+            series: the hourly points of each measure, as returned by get_hourly_series of the client
+            only_new: False to also write hours older than the last imported one, for a backfill
+
+        Returns:
+            The number of statistics written
+        """
+        count = 0
+        for key in STATISTICS_MEASURES:
+            points = series.get(key)
+            if not points:
+                continue
+
+            statistic_id = self.get_statistic_id(key)
+            last_imported = await self._async_get_last_imported(statistic_id)
+
+            # one value per hour, the last one wins if the cloud ever gives two for the same hour
+            hours = {}
+            for date_time, value in points:
+                hours[self._to_hour_start(date_time)] = value
+
+            stats = [
+                StatisticData(start=start, mean=value, min=value, max=value)
+                for start, value in sorted(hours.items())
+                if only_new is False or last_imported is None or start > last_imported
+            ]
+            if len(stats) == 0:
+                continue
+
+            async_add_external_statistics(self.hass, self._get_metadata(key), stats)
+            if last_imported is None or stats[-1]["start"] > last_imported:
+                self._last_imported[statistic_id] = stats[-1]["start"]
+            count += len(stats)
+            _LOGGER.debug("Imported %d hourly statistics for %s", len(stats), statistic_id)
+
+        return count
+
+
+class HydrocaptHistoryBackfill:
+    """Read past periods of history from the cloud and import them into the statistics.
+
+    Each day, week or month is one request, several run at once. Periods fully in the past are recorded
+    in a store once imported, so a backfill interrupted by an error or a restart only reads what is missing.
+    """
+
+    def __init__(self, hass: HomeAssistant, client, store: Store) -> None:
+        self.hass = hass
+        self.api = client
+        self._store = store
+        # type_date -> iso dates of the periods already imported
+        self._done = None
+
+    async def _async_load(self):
+        if self._done is None:
+            data = await self._store.async_load() or {}
+            self._done = {k: set(v) for k, v in data.get("done", {}).items()}
+        return self._done
+
+    def _async_save(self):
+        self._store.async_delay_save(
+            lambda: {"done": {k: sorted(v) for k, v in self._done.items()}}, BACKFILL_SAVE_DELAY
+        )
+
+    async def async_backfill(
+        self,
+        importer: HydrocaptStatisticsImporter,
+        start: date,
+        end: date,
+        type_date: str,
+        max_concurrent: int = DEFAULT_BACKFILL_MAX_CONCURRENT,
+        deadline=None,
+    ):
+        """Import [start, end], skipping the periods a previous backfill already imported.
+
+        Returns:
+            (number of periods read, number of periods that failed, number of statistics written)
+        """
+        done = (await self._async_load()).setdefault(type_date, set())
+        today = dt_util.now().date()
+
+        periods = [p for p in get_history_periods(start, end, type_date) if p.isoformat() not in done]
+        semaphore = asyncio.Semaphore(max(1, max_concurrent))
+
+        async def _async_backfill_period(period: date):
+            async with semaphore:
+                series = await self.api.get_pool_history_series(period, type_date, deadline=deadline)
+                count = await importer.async_import(series, only_new=False)
+            # the current period is still filling up: read it again next time
+            if get_next_history_period(period, type_date) <= today:
+                done.add(period.isoformat())
+                self._async_save()
+            return count
+
+        results = await asyncio.gather(*[_async_backfill_period(p) for p in periods], return_exceptions=True)
+
+        failed = 0
+        count = 0
+        for period, result in zip(periods, results):
+            if isinstance(result, BaseException):
+                failed += 1
+                _LOGGER.warning("Can't backfill the %s of %s: %s", type_date, period, result)
+            else:
+                count += result
+
+        return len(periods), failed, count
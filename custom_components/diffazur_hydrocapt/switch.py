@@ -73,8 +73,7 @@ class DiffazurHydrocaptSwitchEntity(DiffazurHydrocaptEntity, SwitchEntity):
 
     async def async_turn_on(self, **kwargs):  # pylint: disable=unused-argument
         """Turn on the switch."""
-        data = await self.hass.async_add_executor_job(
-            self.coordinator.set_command_state,
+        data = await self.coordinator.set_command_state(
             self.entity_description.key,
             self.entity_description.option_on,
         )
@@ -85,8 +84,7 @@ class DiffazurHydrocaptSwitchEntity(DiffazurHydrocaptEntity, SwitchEntity):
 
     async def async_turn_off(self, **kwargs):  # pylint: disable=unused-argument
         """Turn off the switch."""
-        data = await self.hass.async_add_executor_job(
-            self.coordinator.set_command_state,
+        data = await self.coordinator.set_command_state(
             self.entity_description.key,
             self.entity_description.option_off,
         )
@@ -108,8 +106,7 @@ class DiffazurHydrocapSwitchHourTimerEntity(DiffazurHydrocaptEntity, SwitchEntit
 
     async def async_turn_on(self, **kwargs):  # pylint: disable=unused-argument
         """Turn on the switch."""
-        data = await self.hass.async_add_executor_job(
-            self.coordinator.set_consign_timer_hour,
+        data = await self.coordinator.set_consign_timer_hour(
             self.entity_description.key,
             self.entity_description.hour_idx,
             True,
@@ -121,8 +118,7 @@ class DiffazurHydrocapSwitchHourTimerEntity(DiffazurHydrocaptEntity, SwitchEntit
 
     async def async_turn_off(self, **kwargs):  # pylint: disable=unused-argument
         """Turn off the switch."""
-        data = await self.hass.async_add_executor_job(
-            self.coordinator.set_consign_timer_hour,
+        data = await self.coordinator.set_consign_timer_hour(
             self.entity_description.key,
             self.entity_description.hour_idx,
             False,
@@ -0,0 +1,156 @@
+"""Test the Hydrocapt asyncio client write confirmations."""
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from custom_components.diffazur_hydrocapt.hydrocapt_lib import async_client
+from custom_components.diffazur_hydrocapt.hydrocapt_lib.async_client import (
+    AsyncHydrocaptClient,
+)
+from custom_components.diffazur_hydrocapt.hydrocapt_lib.const import (
+    HYDROCAPT_HEATING_REGULATION_TEMPARATURE_CONSIGN,
+)
+from custom_components.diffazur_hydrocapt.hydrocapt_lib.exceptions import (
+    HydrocaptClosedError,
+)
+
+
+async def test_optimistic_state_kept_until_confirmed(monkeypatch):
+    """The written state is shown while the cloud still reports the old one."""
+    monkeypatch.setattr(async_client, "WAIT_BETWEEN_CHACK_S", 0.01)
+    async with AsyncHydrocaptClient("test", "test", pool_internal_id=1) as client:
+        client._set_command_states = AsyncMock(return_value=True)
+        client._get_commands_current_states = AsyncMock(
+            return_value={"Light": "Pool Light OFF", "pH Regulation": "pH Regulation AUTO"}
+        )
+
+        await client.set_command_state("Light", "Pool Light ON", wait_confirm=False)
+        task = client.get_confirm_task("Light")
+        assert task is not None
+
+        # let the confirmation read the not yet updated state
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert client._get_commands_current_states.await_count >= 1
+        assert client.get_packaged_data()["Light"] == "Pool Light ON"
+
+        # a refresh in the meantime doesn't flip it back either
+        await client.get_commands_current_states()
+        assert client.get_packaged_data()["Light"] == "Pool Light ON"
+
+        client._get_commands_current_states.return_value = {
+            "Light": "Pool Light ON",
+            "pH Regulation": "pH Regulation OFF",
+        }
+        await task
+        assert client.get_packaged_data()["Light"] == "Pool Light ON"
+        assert client.get_packaged_data()["pH Regulation"] == "pH Regulation OFF"
+
+
+async def test_empty_past_period_is_no_data():
+    """A past period without any record is not taken for an expired session."""
+    async with AsyncHydrocaptClient("test", "test", pool_internal_id=1) as client:
+        session = client._get_session()
+        session.get = AsyncMock(return_value=b'{"records": []}')
+        session.relogin = AsyncMock()
+
+        assert await client.get_pool_history_series("2020-01-01", "month") == {}
+        session.relogin.assert_not_awaited()
+
+
+async def test_no_new_session_after_close():
+    """A call made after aclose fails instead of opening a websession nobody closes."""
+    client = AsyncHydrocaptClient("test", "test", pool_internal_id=1)
+    client._get_session()
+    websession = client._websession
+    await client.aclose()
+    assert websession.closed
+
+    with pytest.raises(HydrocaptClosedError):
+        await client.fetch_all_data()
+    with pytest.raises(HydrocaptClosedError):
+        await client.queue_consign_timer_hour("Filtration Timer", 0, True)
+    assert client._websession is None and client.session is None
+
+
+async def test_timer_hour_edits_coalesced(monkeypatch):
+    """Hour edits of a timer made in a row are saved once, each hour with its last value."""
+    monkeypatch.setattr(async_client, "WAIT_BETWEEN_CHACK_S", 0.01)
+    async with AsyncHydrocaptClient("test", "test", pool_internal_id=1, timer_coalesce_window_s=0.05) as client:
+        timer = [False] * 24
+        expected = [False, True, True] + [False] * 21
+        client._saved_consigns = {"Filtration Timer": timer}
+        client._set_consign = AsyncMock(return_value=True)
+        client._get_current_consigns = AsyncMock(return_value={"Filtration Timer": expected})
+
+        task = await client.queue_consign_timer_hour("Filtration Timer", 0, True)
+        assert await client.queue_consign_timer_hour("Filtration Timer", 1, True) is task
+        assert await client.queue_consign_timer_hour("Filtration Timer", 2, True) is task
+        assert await client.queue_consign_timer_hour("Filtration Timer", 0, False) is task
+        # shown at once, without touching the list already published
+        assert client.get_packaged_data()["Filtration Timer"] == expected
+        assert timer == [False] * 24
+        client._set_consign.assert_not_awaited()
+
+        # not a timer, or not an hour
+        assert await client.queue_consign_timer_hour("Filtration Timer", 24, True) is None
+        assert await client.queue_consign_timer_hour(HYDROCAPT_HEATING_REGULATION_TEMPARATURE_CONSIGN, 0, True) is None
+
+        await task
+        client._set_consign.assert_awaited_once_with("Filtration Timer", expected)
+
+        await client.get_confirm_task("Filtration Timer")
+        assert client.get_packaged_data()["Filtration Timer"] == expected
+
+
+@pytest.mark.parametrize(
+    "content, valid",
+    [
+        (b"<root><status>OK</status><datas><name>You are not authenticated</name></datas></root>", True),
+        (b"<root><status>You are not authenticated</status></root>", False),
+        (b"<html>You are not authenticated</html", False),
+        (b"<html>login page</html", True),
+    ],
+)
+async def test_restored_session_check(content, valid):
+    """A restored session is judged expired from the status of the answer, from its raw body only when it isn't xml."""
+    async with AsyncHydrocaptClient("test", "test", pool_internal_id=1) as client:
+        session = client._get_session()
+        session._inner_request = AsyncMock(return_value=content)
+
+        assert await session._is_restored_session_valid() is valid
+
+
+async def test_timer_hour_edit_during_save(monkeypatch):
+    """An hour edited while the previous edits are being saved is not hidden by their save."""
+    monkeypatch.setattr(async_client, "WAIT_BETWEEN_CHACK_S", 0.01)
+    async with AsyncHydrocaptClient("test", "test", pool_internal_id=1, timer_coalesce_window_s=0.01) as client:
+        saving = asyncio.Event()
+        release = asyncio.Event()
+
+        async def _slow_save(consign, value):
+            saving.set()
+            await release.wait()
+            return True
+
+        first = [True] + [False] * 23
+        both = [True, False, False, True] + [False] * 20
+        client._saved_consigns = {"Filtration Timer": [False] * 24}
+        client._set_consign = AsyncMock(side_effect=_slow_save)
+        client._get_current_consigns = AsyncMock(return_value={"Filtration Timer": both})
+
+        task = await client.queue_consign_timer_hour("Filtration Timer", 0, True)
+        await saving.wait()
+        next_task = await client.queue_consign_timer_hour("Filtration Timer", 3, True)
+        assert next_task is not task
+
+        release.set()
+        await task
+        client._set_consign.assert_awaited_once_with("Filtration Timer", first)
+        assert client.get_packaged_data()["Filtration Timer"] == both
+
+        await next_task
+        client._set_consign.assert_awaited_with("Filtration Timer", both)
+        await client.get_confirm_task("Filtration Timer")
+        assert client.get_packaged_data()["Filtration Timer"] == both
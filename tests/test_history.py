@@ -0,0 +1,122 @@
+"""Test the columnar parsing of the Hydrocapt history answers."""
+from datetime import date, datetime, timedelta
+import math
+
+from dateutil.parser import parse
+import pytest
+
+from custom_components.diffazur_hydrocapt.hydrocapt_lib import history
+from custom_components.diffazur_hydrocapt.hydrocapt_lib.client import (
+    HydrocaptClientBase,
+)
+from custom_components.diffazur_hydrocapt.hydrocapt_lib.history import (
+    get_history_periods,
+    get_next_history_period,
+    parse_history_arrays,
+    parse_history_dates,
+)
+
+DAY = "2024-03-16"
+
+DAY_ANSWER = {
+    "records": [
+        {"typeInfo": "DATE", "values": [DAY] * 25},
+        {"typeInfo": "PH", "values": ["7.2", "--.-", "7.3"] + ["--.-"] * 22},
+        {"typeInfo": "WATER_TEMP", "values": ["25.5"] * 4 + ["---"] * 21},
+        {"typeInfo": "ORP", "values": ["--"] * 25},
+        {"typeInfo": "NOT A MEASURE", "values": ["1"] * 25},
+    ]
+}
+
+
+@pytest.fixture(params=["numpy", "array"])
+def columns(request, monkeypatch):
+    """Run the test with numpy columns, then with array('d') ones."""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(history, "np", None)
+    return request.param
+
+
+def test_day_dates_match_previous_date_time():
+    """A run of the same date is hourly: the k-th value is k hours after it, as date_time always was."""
+    dates = [DAY] * 25
+    parsed = parse_history_dates(dates)
+    for num_hours in range(25):
+        assert parsed[num_hours] == parse(dates[num_hours]) + timedelta(hours=num_hours)
+
+
+def test_distinct_and_invalid_dates():
+    """Dates with their own time are kept, a new run restarts at its own date, unreadable dates are None."""
+    assert parse_history_dates(["2024-03-11 00:00:00", "2024-03-11 06:00:00", "2024-03-12"]) == [
+        datetime(2024, 3, 11, 0),
+        datetime(2024, 3, 11, 6),
+        datetime(2024, 3, 12, 0),
+    ]
+    assert parse_history_dates([DAY, DAY, "2024-03-17", "2024-03-17"]) == [
+        datetime(2024, 3, 16, 0),
+        datetime(2024, 3, 16, 1),
+        datetime(2024, 3, 17, 0),
+        datetime(2024, 3, 17, 1),
+    ]
+    assert parse_history_dates(["not a date", "not a date", None]) == [None, None, None]
+
+
+def test_parse_history_arrays(columns):
+    """Each measure is one float column, NaN where the cloud has no value."""
+    arrays = parse_history_arrays(DAY_ANSWER, DAY)
+
+    assert len(arrays) == 25
+    assert set(arrays.columns) == {"ph", "water_temperature", "redox"}
+    assert arrays.columns["ph"][0] == 7.2 and math.isnan(arrays.columns["ph"][1])
+
+    assert arrays.latest_valid_index("ph") == 2
+    assert arrays.latest_valid_index("water_temperature") == 3
+    assert arrays.latest_valid_index("redox") is None
+    assert arrays.latest_valid_index("conductivity") is None
+
+    assert arrays.get_datetime(2) == datetime(2024, 3, 16, 2)
+    assert arrays.get_series("ph") == [(datetime(2024, 3, 16, 0), 7.2), (datetime(2024, 3, 16, 2), 7.3)]
+    assert arrays.get_series("redox") == []
+    assert arrays.get_series("conductivity") == []
+
+
+def test_parse_history_arrays_without_dates(columns):
+    """Without DATE record the values are the hours of today."""
+    arrays = parse_history_arrays({"records": [{"typeInfo": "PH", "values": ["7.0", "7.1"]}]}, DAY)
+
+    assert len(arrays) == 25
+    assert arrays.get_series("ph") == [(datetime(2024, 3, 16, 0), 7.0), (datetime(2024, 3, 16, 1), 7.1)]
+
+
+def test_latest_measures(columns):
+    """The latest values and their date_time, as read before the columnar parsing."""
+    cur_data = HydrocaptClientBase("test", "test")._parse_pool_history(DAY_ANSWER, DAY)
+
+    assert cur_data["ph"] == 7.3
+    assert cur_data["water_temperature"] == 25.5
+    # a measure without any value in the day reads -1, a missing one None
+    assert cur_data["redox"] == -1.0
+    assert cur_data["conductivity"] is None
+    # the date of the last pH value
+    assert cur_data["date_time"] == parse(DAY) + timedelta(hours=2)
+
+
+def test_history_periods():
+    """Weeks start on monday and months on their first day."""
+    assert get_history_periods(date(2024, 3, 13), date(2024, 3, 20), "week") == [
+        date(2024, 3, 11),
+        date(2024, 3, 18),
+    ]
+    assert get_history_periods(date(2023, 12, 15), date(2024, 2, 1), "month") == [
+        date(2023, 12, 1),
+        date(2024, 1, 1),
+        date(2024, 2, 1),
+    ]
+    assert get_history_periods(date(2024, 2, 28), date(2024, 3, 1), "day") == [
+        date(2024, 2, 28),
+        date(2024, 2, 29),
+        date(2024, 3, 1),
+    ]
+    assert get_next_history_period(date(2024, 1, 1), "month") == date(2024, 2, 1)
@@ -0,0 +1,206 @@
+"""Test the Hydrocapt retry policies and circuit breaker."""
+import asyncio
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+
+from custom_components.diffazur_hydrocapt.hydrocapt_lib import retry
+from custom_components.diffazur_hydrocapt.hydrocapt_lib.async_client import (
+    AsyncHydrocaptClient,
+)
+from custom_components.diffazur_hydrocapt.hydrocapt_lib.deadline import (
+    HydrocaptDeadline,
+)
+from custom_components.diffazur_hydrocapt.hydrocapt_lib.exceptions import (
+    HydrocaptAuthError,
+    HydrocaptCircuitOpenError,
+    HydrocaptConnectionError,
+    HydrocaptDeadlineError,
+    HydrocaptProtocolError,
+    HydrocaptServerError,
+    HydrocaptTimeoutError,
+)
+from custom_components.diffazur_hydrocapt.hydrocapt_lib.retry import (
+    HYDROCAPT_READ_RETRY_POLICIES,
+    HYDROCAPT_WRITE_RETRY_POLICIES,
+    NO_RETRY_POLICY,
+    HydrocaptCircuitBreaker,
+    HydrocaptRetryPolicy,
+    get_retry_policy,
+)
+
+
+def test_read_retry_policies():
+    """Reads retry network and server failures, and login again on auth failures."""
+    auth = get_retry_policy(HydrocaptAuthError(), HYDROCAPT_READ_RETRY_POLICIES)
+    assert auth.max_attempts == 2 and auth.relogin is True
+
+    connection = get_retry_policy(HydrocaptConnectionError(), HYDROCAPT_READ_RETRY_POLICIES)
+    assert connection.max_attempts == 3 and connection.relogin is False
+
+    # a request timeout is a network failure, found through the exception mro
+    assert get_retry_policy(HydrocaptTimeoutError(), HYDROCAPT_READ_RETRY_POLICIES) is connection
+
+    assert get_retry_policy(HydrocaptServerError(), HYDROCAPT_READ_RETRY_POLICIES).max_attempts == 3
+    assert get_retry_policy(HydrocaptProtocolError(), HYDROCAPT_READ_RETRY_POLICIES) is NO_RETRY_POLICY
+
+
+def test_write_retry_policies():
+    """A write refused by the cloud is not sent again."""
+    assert get_retry_policy(HydrocaptAuthError(), HYDROCAPT_WRITE_RETRY_POLICIES).relogin is True
+    assert get_retry_policy(HydrocaptConnectionError(), HYDROCAPT_WRITE_RETRY_POLICIES).max_attempts == 2
+    assert get_retry_policy(HydrocaptServerError(), HYDROCAPT_WRITE_RETRY_POLICIES) is NO_RETRY_POLICY
+    assert get_retry_policy(HydrocaptProtocolError(), HYDROCAPT_WRITE_RETRY_POLICIES) is NO_RETRY_POLICY
+
+
+@pytest.mark.parametrize("policies", [HYDROCAPT_READ_RETRY_POLICIES, HYDROCAPT_WRITE_RETRY_POLICIES])
+def test_no_retry_past_deadline_or_open_circuit(policies):
+    """Neither an exhausted deadline nor an open circuit is retried."""
+    assert get_retry_policy(HydrocaptDeadlineError(), policies) is NO_RETRY_POLICY
+    assert get_retry_policy(HydrocaptCircuitOpenError(10.0), policies) is NO_RETRY_POLICY
+
+
+def test_retry_delay():
+    """The backoff doubles up to its cap, with jitter in its upper half."""
+    policy = HydrocaptRetryPolicy(max_attempts=5, base_delay_s=1.0, max_delay_s=4.0)
+    for attempt, cap in ((1, 1.0), (2, 2.0), (3, 4.0), (4, 4.0)):
+        delay = policy.get_delay(attempt)
+        assert cap / 2.0 <= delay <= cap
+
+    assert NO_RETRY_POLICY.get_delay(1) == 0.0
+
+
+def _open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.before_call()
+        breaker.record_failure(HydrocaptConnectionError())
+
+
+def test_breaker_opens_after_threshold():
+    """Consecutive network or server failures open the circuit, a success resets the count."""
+    breaker = HydrocaptCircuitBreaker(failure_threshold=3, reset_timeout_s=60.0)
+
+    breaker.record_failure(HydrocaptConnectionError())
+    breaker.record_failure(HydrocaptServerError())
+    breaker.record_success()
+    breaker.record_failure(HydrocaptConnectionError())
+    breaker.record_failure(HydrocaptConnectionError())
+    assert breaker.state == HydrocaptCircuitBreaker.CLOSED
+    assert breaker.before_call() is None
+
+    breaker.record_failure(HydrocaptTimeoutError())
+    assert breaker.state == HydrocaptCircuitBreaker.OPEN
+    assert breaker.is_open
+    assert 0.0 < breaker.retry_in() <= 60.0
+
+    with pytest.raises(HydrocaptCircuitOpenError) as exc_info:
+        breaker.before_call()
+    assert exc_info.value.retry_in_s > 0.0
+
+
+def test_breaker_ignores_errors_of_an_up_cloud():
+    """Auth, parse and deadline failures don't count as an outage."""
+    breaker = HydrocaptCircuitBreaker(failure_threshold=1, reset_timeout_s=60.0)
+
+    breaker.record_failure(HydrocaptAuthError())
+    breaker.record_failure(HydrocaptProtocolError())
+    breaker.record_failure(HydrocaptDeadlineError())
+    assert breaker.state == HydrocaptCircuitBreaker.CLOSED
+
+
+def test_breaker_half_open_single_trial():
+    """Once the reset timeout elapsed only one trial goes through, its success closes the circuit."""
+    breaker = HydrocaptCircuitBreaker(failure_threshold=2, reset_timeout_s=0.0)
+    _open_breaker(breaker)
+    assert breaker.state == HydrocaptCircuitBreaker.HALF_OPEN
+
+    trial = breaker.before_call()
+    assert trial is not None
+    with pytest.raises(HydrocaptCircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    breaker.release_trial(trial)
+    assert breaker.state == HydrocaptCircuitBreaker.CLOSED
+    assert breaker.before_call() is None
+
+
+def test_breaker_failed_trial_reopens():
+    """A single failure of the trial opens the circuit again."""
+    breaker = HydrocaptCircuitBreaker(failure_threshold=2, reset_timeout_s=60.0)
+    _open_breaker(breaker)
+    # skip the reset timeout
+    breaker.reset_timeout_s = 0.0
+
+    trial = breaker.before_call()
+    assert trial is not None
+    breaker.reset_timeout_s = 60.0
+    breaker.record_failure(HydrocaptConnectionError())
+    breaker.release_trial(trial)
+    assert breaker.state == HydrocaptCircuitBreaker.OPEN
+
+
+def test_breaker_released_trial():
+    """A trial ended without outcome lets the next call be the trial, a stale token changes nothing."""
+    breaker = HydrocaptCircuitBreaker(failure_threshold=2, reset_timeout_s=0.0)
+    _open_breaker(breaker)
+
+    trial = breaker.before_call()
+    breaker.release_trial(trial)
+    assert breaker.state == HydrocaptCircuitBreaker.HALF_OPEN
+
+    next_trial = breaker.before_call()
+    assert next_trial is not None and next_trial is not trial
+
+    breaker.release_trial(trial)
+    breaker.release_trial(None)
+    with pytest.raises(HydrocaptCircuitOpenError):
+        breaker.before_call()
+
+
+def test_deadline_exhaustion():
+    """An exhausted deadline raises its own error, not a network one."""
+    deadline = HydrocaptDeadline(0.0)
+    with pytest.raises(HydrocaptDeadlineError):
+        deadline.check()
+    with pytest.raises(HydrocaptDeadlineError):
+        deadline.sleep(1.0)
+    assert not issubclass(HydrocaptDeadlineError, HydrocaptConnectionError)
+
+
+async def test_cancelled_trial_does_not_keep_circuit_open():
+    """A half-open trial cancelled by the deadline gives way to a new trial."""
+    breaker = HydrocaptCircuitBreaker(failure_threshold=1, reset_timeout_s=0.0)
+    _open_breaker(breaker)
+
+    async with AsyncHydrocaptClient("test", "test", circuit_breaker=breaker) as client:
+
+        async def _hang():
+            await asyncio.sleep(3600)
+
+        with pytest.raises(HydrocaptDeadlineError):
+            await client._run_with_deadline(client._call_with_retry(_hang), 0.01)
+
+        assert breaker.state == HydrocaptCircuitBreaker.HALF_OPEN
+        assert breaker.before_call() is not None
+
+
+async def test_half_open_fetch_sends_a_single_trial(monkeypatch):
+    """While half-open, a refresh on an established session lets one read through, not all of them."""
+    monkeypatch.setattr(retry.HydrocaptRetryPolicy, "get_delay", lambda self, attempt: 0.0)
+    breaker = HydrocaptCircuitBreaker(failure_threshold=3, reset_timeout_s=60.0)
+    _open_breaker(breaker)
+    # skip the reset timeout without making the next failure half-open too
+    breaker._opened_at = time.monotonic() - breaker.reset_timeout_s
+
+    async with AsyncHydrocaptClient("test", "test", pool_internal_id=1, circuit_breaker=breaker) as client:
+        session = client._get_session()
+        session._session = client._websession
+        session._inner_request = AsyncMock(side_effect=HydrocaptConnectionError("down"))
+
+        with pytest.raises((HydrocaptConnectionError, HydrocaptCircuitOpenError)):
+            await client.fetch_all_data()
+
+        assert session._inner_request.await_count == 1
+        assert breaker.state == HydrocaptCircuitBreaker.OPEN
@@ -0,0 +1,84 @@
+"""Test the refresh scheduling on the hourly measure slots."""
+from datetime import datetime, timedelta
+
+from custom_components.diffazur_hydrocapt.const import (
+    SLOT_BACKOFF_MIN,
+    SLOT_DEFAULT_LAG,
+    SLOT_MARGIN,
+    SLOT_MIN_INTERVAL,
+    SLOT_PERIOD,
+)
+from custom_components.diffazur_hydrocapt.scheduler import HydrocaptSlotScheduler
+
+SLOT = datetime(2024, 3, 16, 10)
+
+
+def _at(minutes, hours=0):
+    return SLOT + timedelta(hours=hours, minutes=minutes)
+
+
+def test_no_slot_seen_yet():
+    """Poll every period until a first slot is known."""
+    scheduler = HydrocaptSlotScheduler()
+    scheduler.observe(None, _at(3))
+
+    assert scheduler.expected_time() is None
+    assert scheduler.next_interval(_at(3)) == SLOT_PERIOD
+
+
+def test_refresh_just_after_next_slot():
+    """The next refresh is planned at the next slot plus the publication lag and a margin."""
+    scheduler = HydrocaptSlotScheduler()
+    scheduler.observe(SLOT, _at(7))
+
+    # the first refresh doesn't tell when the slot was published
+    assert scheduler.lag == SLOT_DEFAULT_LAG
+    assert scheduler.expected_time() == SLOT + SLOT_PERIOD + SLOT_DEFAULT_LAG + SLOT_MARGIN
+    assert scheduler.next_interval(_at(7)) == scheduler.expected_time() - _at(7)
+
+    # never closer than the min interval
+    assert scheduler.next_interval(scheduler.expected_time() - timedelta(seconds=10)) == SLOT_MIN_INTERVAL
+
+
+def test_lag_learnt_from_planned_refresh():
+    """A slot seen by the planned refresh gives its lag, margin excluded."""
+    scheduler = HydrocaptSlotScheduler()
+    scheduler.observe(SLOT, _at(7))
+
+    planned = scheduler.expected_time()
+    scheduler.observe(SLOT + SLOT_PERIOD, planned)
+    assert scheduler.lag == SLOT_DEFAULT_LAG
+
+    # the same refresh again doesn't make the lag creep up
+    scheduler.observe(SLOT + 2 * SLOT_PERIOD, scheduler.expected_time())
+    assert scheduler.lag == SLOT_DEFAULT_LAG
+
+
+def test_late_slot_backs_off():
+    """A late slot is polled with a growing backoff, its lag is then taken between the miss and the hit."""
+    scheduler = HydrocaptSlotScheduler()
+    scheduler.observe(SLOT, _at(7))
+
+    expected = scheduler.expected_time()
+    scheduler.observe(SLOT, expected)
+    first = scheduler.next_interval(expected)
+    assert 0.8 * 2 * SLOT_BACKOFF_MIN <= first <= 1.2 * 2 * SLOT_BACKOFF_MIN
+
+    scheduler.observe(SLOT, expected + timedelta(minutes=4))
+    second = scheduler.next_interval(expected + timedelta(minutes=4))
+    assert 0.8 * 4 * SLOT_BACKOFF_MIN <= second <= 1.2 * 4 * SLOT_BACKOFF_MIN
+
+    # published between the last miss and this refresh
+    scheduler.observe(SLOT + SLOT_PERIOD, expected + timedelta(minutes=8))
+    assert scheduler.lag == (expected + timedelta(minutes=4) - SLOT - SLOT_PERIOD) + timedelta(minutes=2)
+    assert scheduler.next_interval(expected + timedelta(minutes=8)) > SLOT_PERIOD / 2
+
+
+def test_lag_after_a_gap_ignored():
+    """A slot first seen more than a period after it doesn't tell when it was published."""
+    scheduler = HydrocaptSlotScheduler()
+    scheduler.observe(SLOT, _at(7))
+    scheduler.observe(SLOT + 3 * SLOT_PERIOD, _at(30, hours=4))
+
+    assert scheduler.lag == SLOT_DEFAULT_LAG
+    assert scheduler.expected_time() == SLOT + 4 * SLOT_PERIOD + SLOT_DEFAULT_LAG + SLOT_MARGIN
@@ -0,0 +1,123 @@
+"""Test the local columnar store of the hourly measures."""
+from datetime import datetime, timedelta
+import math
+
+import pytest
+
+from custom_components.diffazur_hydrocapt.hydrocapt_lib import history, store
+from custom_components.diffazur_hydrocapt.hydrocapt_lib.store import (
+    HydrocaptSeriesStore,
+)
+
+START = datetime(2024, 3, 16)
+METRICS = ["ph", "redox"]
+
+
+@pytest.fixture(params=["numpy", "array"])
+def columns(request, monkeypatch):
+    """Run the test with numpy columns, then with array('d') ones."""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(history, "np", None)
+        monkeypatch.setattr(store, "np", None)
+    return request.param
+
+
+def _hours(first, count, value=lambda i: float(i)):
+    return [(START + timedelta(hours=i), value(i)) for i in range(first, first + count)]
+
+
+def _values(column):
+    return [None if math.isnan(v) else v for v in column]
+
+
+def test_append_and_reopen(tmp_path, columns):
+    """Appended hours are kept across a reopen, only newer hours are appended."""
+    path = str(tmp_path / "store" / "pool.bin")
+    with HydrocaptSeriesStore(path, METRICS) as series_store:
+        assert len(series_store) == 0 and series_store.last_time is None
+        assert series_store.append_series({"ph": _hours(0, 3), "redox": _hours(0, 2), "unknown": _hours(0, 5)}) == 3
+        # older and already stored hours are not appended again
+        assert series_store.append_series({"ph": _hours(1, 3)}) == 1
+
+    with HydrocaptSeriesStore(path) as series_store:
+        assert series_store.metrics == METRICS
+        assert len(series_store) == 4
+        assert series_store.last_time == START + timedelta(hours=3)
+
+        data = series_store.query()
+        assert [data.get_datetime(i) for i in range(len(data))] == [START + timedelta(hours=i) for i in range(4)]
+        assert _values(data.columns["ph"]) == [0.0, 1.0, 2.0, 3.0]
+        assert _values(data.columns["redox"]) == [0.0, 1.0, None, None]
+
+
+def test_fill_in_missing_values(tmp_path, columns):
+    """A value the cloud didn't have yet is filled in, a stored one is never overwritten."""
+    with HydrocaptSeriesStore(str(tmp_path / "pool.bin"), METRICS) as series_store:
+        series_store.append_series({"ph": _hours(0, 3)})
+        assert series_store.append_series({"ph": _hours(0, 3, lambda i: 9.0), "redox": _hours(1, 1, lambda i: 700.0)}) == 0
+
+        data = series_store.query()
+        assert _values(data.columns["ph"]) == [0.0, 1.0, 2.0]
+        assert _values(data.columns["redox"]) == [None, 700.0, None]
+
+
+def test_grow(tmp_path, columns):
+    """Columns are moved without loss when the capacity doubles."""
+    path = str(tmp_path / "pool.bin")
+    count = store._INITIAL_CAPACITY * 2 + 10
+    with HydrocaptSeriesStore(path, METRICS) as series_store:
+        series_store.append_series({"ph": _hours(0, 10), "redox": _hours(0, 10, lambda i: -float(i))})
+        series_store.append_series({"ph": _hours(10, count - 10), "redox": _hours(10, count - 10, lambda i: -float(i))})
+        assert len(series_store) == count
+
+    with HydrocaptSeriesStore(path) as series_store:
+        data = series_store.query()
+        assert len(data) == count
+        assert _values(data.columns["ph"]) == [float(i) for i in range(count)]
+        assert _values(data.columns["redox"]) == [-float(i) for i in range(count)]
+        assert data.get_datetime(count - 1) == START + timedelta(hours=count - 1)
+
+
+def test_query_range(tmp_path, columns):
+    """Both ends of the range are included, and optional."""
+    with HydrocaptSeriesStore(str(tmp_path / "pool.bin"), METRICS) as series_store:
+        series_store.append_series({"ph": _hours(0, 10)})
+
+        data = series_store.query(START + timedelta(hours=2), START + timedelta(hours=4), metrics=["ph"])
+        assert list(data.columns) == ["ph"]
+        assert _values(data.columns["ph"]) == [2.0, 3.0, 4.0]
+
+        assert _values(series_store.query(start=START + timedelta(hours=8)).columns["ph"]) == [8.0, 9.0]
+        assert _values(series_store.query(end=START + timedelta(minutes=90)).columns["ph"]) == [0.0, 1.0]
+        assert len(series_store.query(START + timedelta(hours=20), START + timedelta(hours=30))) == 0
+        assert len(series_store.query(START + timedelta(hours=5), START + timedelta(hours=2))) == 0
+
+
+def test_downsample(tmp_path, columns):
+    """Buckets aggregate their valid values, a bucket without any reads NaN."""
+    with HydrocaptSeriesStore(str(tmp_path / "pool.bin"), METRICS) as series_store:
+        series_store.append_series({
+            "ph": _hours(0, 6, lambda i: [7.0, 7.2, float("nan"), 7.6, 8.0, 7.0][i]),
+            "redox": _hours(0, 2, lambda i: 600.0),
+        })
+
+        mean = series_store.downsample(3)
+        assert [mean.get_datetime(i) for i in range(len(mean))] == [START, START + timedelta(hours=3)]
+        assert _values(mean.columns["ph"]) == pytest.approx([7.1, 7.533333], rel=1e-5)
+        assert _values(mean.columns["redox"]) == [600.0, None]
+
+        assert _values(series_store.downsample(3, how="min").columns["ph"]) == [7.0, 7.0]
+        assert _values(series_store.downsample(3, how="max").columns["ph"]) == [7.2, 8.0]
+
+        with pytest.raises(ValueError):
+            series_store.downsample(3, how="median")
+
+
+def test_not_a_store(tmp_path):
+    """Any other file is refused."""
+    path = tmp_path / "pool.bin"
+    path.write_bytes(b"something else entirely, longer than a header")
+    with pytest.raises(ValueError):
+        HydrocaptSeriesStore(str(path))